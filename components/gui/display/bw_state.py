@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     bw_state.py
+# Usage:    Black-and-white display state, decodes the SystemVerilog
+#           model's messages into a bitmap. Does not depend on tkinter.
+#
+
+import logging
+import json
+import numpy as np
+from PIL import Image
+from scaler import Scaler
+
+logger = logging.getLogger(__name__)
+
+class DisplayState:
+    """ GRAM of the display, organized in pages of 8 rows like the SSD1306.
+        Each byte is one column of a page, bit i is row 8*page+i. The
+        addressing (modes, windows) is done by the SystemVerilog model, the
+        messages carry the GRAM position. Pages written since the last
+        get_frame() are tracked and only those are unpacked. """
+    SRV_INV        = "<inverse>"
+    SRV_ONOFF      = "<onoff>"
+    SRV_ENTIRE_ON  = "<globon>"
+    SRV_FLIP_HOR   = "<flipx>"
+    SRV_FLIP_VERT  = "<flipy>"
+
+    def __init__(self, w=128, h=64, scale=2) -> None:
+        assert w % 8 == 0, "Must be multiple of 8 bits"
+        assert h % 8 == 0, "Must be multiple of 8 bits"
+        self.gram = np.zeros((h // 8, w), dtype=np.uint8)
+        self.bitmap = np.zeros((h, w), dtype=np.uint8)
+        self.dirty_pages = np.zeros(h // 8, dtype=bool)
+        # Set by every message that may change the shown image
+        self.dirty = True
+        self.inverted = False
+        self.flipped_x = False
+        self.flipped_y = False
+        self.off_on    = True
+        self.entire_on = False
+        self.adr_mode  = "invalid"
+        self.w = w
+        self.h = h
+        self.scale = scale
+        self.scaler = Scaler(h, w, scale)
+
+    def handle_rx(self, json_data):
+        self.handle_msg(json.loads(json_data))
+
+    def handle_msg(self, frame_dict):
+        if not "type" in frame_dict:
+            logger.warning("Received invalid json: key 'type' does not exist")
+        if frame_dict["type"] == "data":
+            self.handle_data(frame_dict)
+        elif frame_dict["type"] == "burst":
+            self.handle_burst(frame_dict)
+        elif frame_dict["type"] == "cmd":
+            self.handle_cmd(frame_dict)
+
+    def handle_cmd(self, cmd):
+        if DisplayState.SRV_INV in cmd:
+            self.inverted = cmd[DisplayState.SRV_INV]
+        if DisplayState.SRV_ONOFF in cmd:
+            self.off_on = cmd[DisplayState.SRV_ONOFF]
+        if DisplayState.SRV_ENTIRE_ON in cmd:
+            self.entire_on = cmd[DisplayState.SRV_ENTIRE_ON]
+        if DisplayState.SRV_FLIP_HOR in cmd:
+            self.flipped_x = cmd[DisplayState.SRV_FLIP_HOR]
+        if DisplayState.SRV_FLIP_VERT in cmd:
+            self.flipped_y = cmd[DisplayState.SRV_FLIP_VERT]
+        self.dirty = True
+
+    def handle_data(self, data):
+        self.write(data["x"], data["y"] // 8, np.array([data["data"]], dtype=np.uint8))
+
+    def handle_burst(self, burst):
+        """ Hex encoded bytes written to consecutive columns of one page or,
+            if `vertical` is set, to consecutive pages of one column. """
+        data = np.frombuffer(bytes.fromhex(burst["data"]), dtype=np.uint8)
+        self.write(burst["x"], burst["y"] // 8, data, burst.get("vertical", False))
+
+    def write(self, x, page, data, vertical=False):
+        if not (0 <= x < self.w and 0 <= page < self.gram.shape[0]):
+            logger.warning(f"Ignoring write outside of GRAM: x={x}, page={page}")
+            return
+        if vertical:
+            data = data[:self.gram.shape[0]-page]
+            self.gram[page:page+len(data), x] = data
+            self.dirty_pages[page:page+len(data)] = True
+        else:
+            data = data[:self.w-x]
+            self.gram[page, x:x+len(data)] = data
+            self.dirty_pages[page] = True
+        self.dirty = True
+
+    def get_frame(self):
+        """ Shown image (h x w, 0 or 255), the flips are views of the
+            bitmap. """
+        for page in np.flatnonzero(self.dirty_pages):
+            # bit i of a byte is row 8*page+i
+            bits = np.unpackbits(self.gram[page][:, None], axis=1, bitorder="little")
+            self.bitmap[8*page:8*page+8] = 255 * bits.T
+        self.dirty_pages[:] = False
+        self.dirty = False
+
+        if not self.off_on:
+            return np.zeros_like(self.bitmap)
+        frame = self.bitmap if not self.entire_on else np.full_like(self.bitmap, 255)
+        if not self.flipped_x:
+            frame = frame[:, ::-1]
+        if not self.flipped_y:
+            frame = frame[::-1]
+        if self.inverted:
+            frame = 255 - frame
+        return frame
+
+    def get_image(self) -> Image.Image:
+        return self.scaler.get_image(self.get_frame())
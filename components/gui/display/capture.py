@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     capture.py
+# Usage:    Headless display capture, writes the frames received from the
+#           SystemVerilog model to disk without tkinter or an X server.
+#           Can be used as a library, e.g., to assert on framebuffers:
+#
+#             cap = VGACapture(VGASetting(), on_frame=frames.append)
+#             cap.feed(data)
+#
+
+import os
+import sys
+import abc
+import argparse
+import logging
+import numpy as np
+from PIL import Image
+import vga_state
+import bw_state
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../.."))
+from simio import transport
+from simio.client import Client
+from simio.framing import LineFramer
+from simio import log
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PNG = "png"
+FORMAT_NPY = "npy"
+FORMAT_RAW = "raw"
+FORMATS = (FORMAT_PNG, FORMAT_NPY, FORMAT_RAW)
+
+
+class Capture(abc.ABC):
+    """ Frames received lines of one component prefix and calls `on_frame`
+        with each completed frame (H x W x 3 or H x W, uint8). """
+    SRV_PREFIX = None
+
+    def __init__(self, on_frame=None) -> None:
+        self.on_frame = on_frame
+        self.frame_cnt = 0
+        # Ignore frames after this many, 0 for no limit
+        self.max_frames = 0
+        self.framer = LineFramer()
+
+    def feed(self, data: bytes):
+        prefix = self.SRV_PREFIX.encode()
+        frames = [f[len(prefix):].decode() for f in self.framer.feed(data) if f.startswith(prefix)]
+        if frames:
+            self.handle_frames(frames)
+
+    @abc.abstractmethod
+    def handle_frames(self, frames):
+        """ Decode messages (prefix removed), emit() completed frames. """
+
+    def emit(self, frame):
+        if self.max_frames and (self.frame_cnt >= self.max_frames):
+            return
+        self.frame_cnt += 1
+        if self.on_frame is not None:
+            self.on_frame(frame.copy())
+
+
+class VGACapture(Capture):
+    SRV_PREFIX = "[displayvga]-"
+
+    def __init__(self, vga_settings, on_frame=None) -> None:
+        super().__init__(on_frame)
+        self.ds = vga_state.DisplayState(vga_settings=vga_settings)
+        self.ds.on_frame = self.emit
+
+    def handle_frames(self, frames):
+        self.ds.handle_frames(frames)
+
+
+class BWCapture(Capture):
+    """ The SSD1306 has no frame sync, a frame is emitted after every batch
+        of received data that changed the display content. """
+    SRV_PREFIX = "[displaybw]-"
+
+    def __init__(self, w=128, h=64, on_frame=None) -> None:
+        super().__init__(on_frame)
+        self.ds = bw_state.DisplayState(w, h, scale=1)
+        self.last = None
+
+    def handle_frames(self, frames):
+        for f in frames:
+            self.ds.handle_rx(f)
+        if not self.ds.dirty:
+            return
+        frame = self.ds.get_frame()
+        if (self.last is None) or not np.array_equal(frame, self.last):
+            self.last = frame.copy()
+            self.emit(frame)
+
+
+class FrameWriter:
+    """ Writes every `every`-th frame as PNG or NPY file, or appends it to a
+        raw stream (frames.raw). """
+    def __init__(self, output, fmt=FORMAT_PNG, every=1) -> None:
+        assert fmt in FORMATS, f"Unknown format: {fmt}"
+        os.makedirs(output, exist_ok=True)
+        self.output = output
+        self.fmt = fmt
+        self.every = max(every, 1)
+        self.frame_cnt = 0
+        self.raw = open(os.path.join(output, "frames.raw"), "ab") if fmt == FORMAT_RAW else None
+
+    def __call__(self, frame):
+        idx = self.frame_cnt
+        self.frame_cnt += 1
+        if idx % self.every:
+            return
+        if self.fmt == FORMAT_PNG:
+            Image.fromarray(frame).save(os.path.join(self.output, f"frame_{idx:06d}.png"))
+        elif self.fmt == FORMAT_NPY:
+            np.save(os.path.join(self.output, f"frame_{idx:06d}.npy"), frame)
+        else:
+            self.raw.write(frame.tobytes())
+        logger.info(f"Captured frame {idx} {frame.shape}")
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.close()
+
+
+def run(capture, addr, port, max_frames=0, unix=None, shm=0):
+    """ Feed data from the server into `capture` as fast as it arrives until
+        the connection is closed or `max_frames` frames were captured. """
+    capture.max_frames = max_frames
+    client = Client(capture.SRV_PREFIX, addr=addr, port=port, unix=unix, shm=shm, reconnect=False)
+    client.connect()
+
+    def on_lines(lines):
+        capture.handle_frames(lines)
+        if max_frames and (capture.frame_cnt >= max_frames):
+            client.stop()
+
+    try:
+        client.run(on_lines)
+    finally:
+        client.stop()
+
+
+def main(args):
+    writer = FrameWriter(args.output, fmt=args.format, every=args.every)
+    if args.display == "vga":
+        capture = VGACapture(vga_state.get_vga_settings(args), on_frame=writer)
+    else:
+        capture = BWCapture(on_frame=writer)
+    try:
+        run(capture, args.address, args.port, max_frames=args.frames, unix=args.unix, shm=args.shm*1024)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        logger.info(f"{capture.frame_cnt} frames received")
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Headless capture of SimIO display frames")
+    parser.add_argument("display", choices=("vga", "bw"), help="Display to capture")
+    parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
+    parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
+    transport.add_transport_args(parser)
+    parser.add_argument("-o", "--output", action="store", type=str, default="frames", help="Output directory")
+    parser.add_argument("-F", "--format", action="store", choices=FORMATS, default=FORMAT_PNG, help="Output format")
+    parser.add_argument("-e", "--every", action="store", type=int, default=1, help="Only save every n-th frame")
+    parser.add_argument("-n", "--frames", action="store", type=int, default=0, help="Stop after n frames, 0 to run until the server closes")
+    vga_state.add_vga_args(parser)
+    log.add_log_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    log.setup_logging(args)
+
+    main(args)
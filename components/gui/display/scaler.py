@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     scaler.py
+# Usage:    Integer nearest-neighbour upscaling of display frames into a
+#           preallocated buffer.
+#
+
+import numpy as np
+from PIL import Image
+
+class Scaler:
+    """ Upscales (h, w) or (h, w, c) uint8 frames by `scale`. The output
+        buffer is reused, only rows that changed since the last frame are
+        written. """
+    def __init__(self, h, w, scale, channels=None) -> None:
+        assert scale >= 1, "Scale must be a positive integer"
+        self.scale = scale
+        c = () if channels is None else (channels,)
+        self.last = np.zeros((h, w) + c, dtype=np.uint8)
+        self.out = np.zeros((h*scale, w*scale) + c, dtype=np.uint8)
+        # out as (h, scale, w, scale[, c]), a row of `last` is broadcast to
+        # a scale x scale block per pixel
+        self.blocks = self.out.reshape((h, scale, w, scale) + c)
+
+    def update(self, frame):
+        """ Upscaled frame, valid until the next call. """
+        if self.scale == 1:
+            return frame
+        changed = np.flatnonzero((frame != self.last).reshape(frame.shape[0], -1).any(axis=1))
+        if len(changed) == 0:
+            return self.out
+        if len(changed) > frame.shape[0] // 2:
+            changed = slice(None)
+        self.last[changed] = frame[changed]
+        self.blocks[changed] = self.last[changed][:, None, :, None]
+        return self.out
+
+    def get_image(self, frame) -> Image.Image:
+        return Image.fromarray(self.update(np.ascontiguousarray(frame)))
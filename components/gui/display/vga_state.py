@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     vga_state.py
+# Usage:    VGA display state, decodes the SystemVerilog model's events
+#           into a framebuffer. Does not depend on tkinter.
+#
+
+import os
+import sys
+import logging
+import json
+import numpy as np
+from dataclasses import dataclass
+from PIL import Image
+from scaler import Scaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../.."))
+from simio import log
+
+logger = logging.getLogger(__name__)
+
+# Binary records (WIRE_FORMAT = "bin"): '#' followed by the hex encoded fields
+BIN_MARKER = "#"
+REC_RGB = 0
+REC_HS  = 1
+REC_VS  = 2
+RECORD_DTYPE = np.dtype([("type", "u1"), ("timestamp", ">u4"), ("r", "u1"), ("g", "u1"), ("b", "u1")])
+
+# Decoded events, see DisplayState.handle_events()
+EVENT_DTYPE = np.dtype([("timestamp", "u4"), ("type", "u1"), ("r", "u1"), ("g", "u1"), ("b", "u1")])
+JSON_EVENT_TYPES = {"rgb": REC_RGB, "hs": REC_HS, "vs": REC_VS}
+
+def decode_records(hex_records) -> np.ndarray:
+    """ Decode a list of hex encoded binary records at once. """
+    return np.frombuffer(bytes.fromhex("".join(hex_records)), dtype=RECORD_DTYPE)
+
+@dataclass
+class VGASetting:
+    width:int = 800
+    height:int = 600
+    h_front_porch_px:int = 40
+    h_sync_pulse_px:int = 128
+    h_back_porch_px:int = 88
+    v_front_porch_ln:int = 1
+    v_sync_pulse_ln:int = 4
+    v_back_porch_ln:int = 23
+    low_active_hs_vs:bool = False
+    color_depth:int=2
+
+
+class DisplayState:
+    def __init__(self, vga_settings:VGASetting, scale=1) -> None:
+        self.h_front_porch_px = vga_settings.h_front_porch_px
+        self.h_sync_pulse_px = vga_settings.h_sync_pulse_px
+        self.h_back_porch_px = vga_settings.h_back_porch_px
+        self.v_front_porch_ln = vga_settings.v_front_porch_ln
+        self.v_sync_pulse_ln = vga_settings.v_sync_pulse_ln
+        self.v_back_porch_ln = vga_settings.v_back_porch_ln
+
+        self.w = vga_settings.width
+        self.h = vga_settings.height
+        self.scale = scale
+        self.color_depth = vga_settings.color_depth
+        self.scaler = Scaler(self.h, self.w, scale, channels=3)
+        self.tracer = log.get_tracer(logger)
+
+        # computed
+        self.total_w_px = self.w + self.h_front_porch_px + self.h_sync_pulse_px + self.h_back_porch_px
+        self.total_h_px = self.h + self.v_front_porch_ln + self.v_sync_pulse_ln + self.v_back_porch_ln
+
+        # Store latest data
+        self.framebuffer = np.zeros((self.h, self.w, 3), dtype=np.uint8)
+
+        self.low_active_hs_vs = vga_settings.low_active_hs_vs
+
+        self.hs_state = self.low_active_hs_vs
+        self.hs_timestamp = 0
+
+        self.vs_state = self.low_active_hs_vs
+        self.vs_timestamp = 0
+
+        self.rgb = (0,0,0)
+        self.fb_update_timestamp = 0
+
+        self.y = 0
+        self.time_per_pixel = 1.0
+
+        # Last completed frame, copied on VSync. on_frame may exchange it
+        # for another buffer of the same shape
+        self.frame = np.zeros_like(self.framebuffer)
+        self.frame_cnt = 0
+        # VSync pulses, including frames without lines (skipped by the model)
+        self.vsync_cnt = 0
+        # Called with the completed frame on VSync
+        self.on_frame = None
+
+    def get_delta_t(self, t_new, t_old):
+        return (t_new - t_old) if (t_new > t_old) else (2**32 - t_old + t_new)
+
+    def handle_rx(self, json_data):
+        frame_dict = json.loads(json_data)
+        if not "type" in frame_dict:
+            logger.warning("Received invalid json: key 'type' does not exist")
+        if frame_dict["type"] == "hs":
+            self.process_hs_change(bool(frame_dict["value"]), frame_dict["timestamp"])
+        elif frame_dict["type"] == "vs":
+            self.process_vs_change(bool(frame_dict["value"]), frame_dict["timestamp"])
+        elif frame_dict["type"] == "rgb":
+            self.process_data_changed(self.adj_color(frame_dict["r"]), 
+                                        self.adj_color(frame_dict["g"]), 
+                                        self.adj_color(frame_dict["b"]), frame_dict["timestamp"])
+
+    def handle_frames(self, frames):
+        """ Decode and process a list of messages (prefix removed) in batches
+            of consecutive JSON messages or binary records. """
+        records = []
+        events = []
+        for frame in frames:
+            if frame.startswith(BIN_MARKER):
+                if events:
+                    self.handle_events(np.array(events, dtype=EVENT_DTYPE))
+                    events = []
+                records.append(frame[1:])
+            else:
+                if records:
+                    self.handle_records(records)
+                    records = []
+                frame_dict = json.loads(frame)
+                if frame_dict.get("type") == "line":
+                    if events:
+                        self.handle_events(np.array(events, dtype=EVENT_DTYPE))
+                        events = []
+                    self.process_line(frame_dict)
+                    continue
+                event = self.parse_event(frame_dict)
+                if event is not None:
+                    events.append(event)
+        if events:
+            self.handle_events(np.array(events, dtype=EVENT_DTYPE))
+        if records:
+            self.handle_records(records)
+
+    def handle_records(self, hex_records):
+        try:
+            records = decode_records(hex_records)
+        except ValueError:
+            logger.warning("Received invalid binary records")
+            return
+        self.handle_events(records)
+
+    def parse_event(self, frame_dict):
+        """ Convert a JSON message into an EVENT_DTYPE tuple, None if invalid. """
+        rtype = JSON_EVENT_TYPES.get(frame_dict.get("type"))
+        if rtype is None:
+            logger.warning("Received invalid json: unknown key 'type'")
+            return None
+        try:
+            if rtype == REC_RGB:
+                return (frame_dict["timestamp"], rtype, frame_dict["r"], frame_dict["g"], frame_dict["b"])
+            return (frame_dict["timestamp"], rtype, frame_dict["value"], 0, 0)
+        except KeyError as e:
+            logger.warning(f"Received invalid json: key {e} does not exist")
+            return None
+
+    def handle_events(self, events):
+        """ Process an array of events with the fields timestamp, type, r, g, b
+            (e.g., EVENT_DTYPE or RECORD_DTYPE). HS/VS events are processed one
+            by one, the RGB changes between them as a whole. """
+        start = 0
+        for i in np.flatnonzero(events["type"] != REC_RGB).tolist() + [len(events)]:
+            if i > start:
+                self.process_data_run(events[start:i])
+            if i < len(events):
+                rtype, value, timestamp = int(events["type"][i]), bool(events["r"][i]), int(events["timestamp"][i])
+                if rtype == REC_HS:
+                    self.process_hs_change(value, timestamp)
+                elif rtype == REC_VS:
+                    self.process_vs_change(value, timestamp)
+            start = i+1
+
+    def process_data_run(self, events):
+        """ Vectorized process_data_changed() for consecutive RGB events. """
+        # of several changes at the same time, only the last one is visible
+        same = events["timestamp"][1:] == events["timestamp"][:-1]
+        if same.any():
+            events = events[np.append(~same, True)]
+        timestamps = events["timestamp"].astype(np.int64)
+        colors = np.empty((len(events)+1, 3), dtype=np.uint8)
+        colors[0] = self.rgb
+        for i, c in enumerate("rgb"):
+            colors[1:, i] = self.adj_color(events[c])
+        # Each event ends the span of the previous color
+        bounds = self.get_x(np.concatenate(([self.fb_update_timestamp], timestamps)))
+        self.fill_row(bounds[:-1], bounds[1:], colors[:-1])
+        self.fb_update_timestamp = int(timestamps[-1])
+        self.rgb = tuple(colors[-1].tolist())
+
+    def process_data_changed(self, r, g, b, timestamp):
+        self.update_framebuffer(self.rgb, timestamp)
+        self.rgb = (r, g, b)
+        
+
+    def process_hs_change(self, hs, timestamp):
+        self.update_framebuffer(self.rgb, timestamp)
+        if (hs == self.low_active_hs_vs) and (self.hs_state != self.low_active_hs_vs):
+            self.time_per_pixel = self.get_delta_t(timestamp, self.hs_timestamp) / self.h_sync_pulse_px
+        self.hs_state = hs
+        self.hs_timestamp = timestamp
+        if hs == self.low_active_hs_vs:
+            self.y += 1
+        if self.tracer is not None:
+            self.tracer("[CHG] HS -> %s @ %s, y <- %s => time per pixel: %s", hs, timestamp, self.y, self.time_per_pixel)
+
+    def process_vs_change(self, vs, timestamp):
+        logger.debug("[CHG] VS -> %s @ %s", vs, timestamp)
+        if (vs == self.low_active_hs_vs) and (self.vs_state != self.low_active_hs_vs):
+            # end of VSync pulse, the frame is complete unless no visible
+            # line was received, e.g., the model skipped the frame
+            self.vsync_cnt += 1
+            if self.y > self.v_back_porch_ln:
+                np.copyto(self.frame, self.framebuffer)
+                self.frame_cnt += 1
+                if self.on_frame is not None:
+                    self.on_frame(self.frame)
+        self.vs_state = vs
+        self.vs_timestamp = timestamp
+        # timestamp may be used to be more precise
+        if vs == self.low_active_hs_vs:
+            self.y = 0
+
+    def process_line(self, line):
+        """ WIRE_FORMAT "line": an HSync edge with the pixels sampled on
+            every pixel clock since the previous edge. At the start of the
+            pulse, these are the pixels of the current line from the end of
+            the last pulse on, i.e., x is the index, no time per pixel. """
+        hs = bool(line["value"])
+        if (hs != self.low_active_hs_vs) and (self.v_back_porch_ln <= self.y < self.v_back_porch_ln + self.h):
+            px = np.frombuffer(bytes.fromhex(line["data"]), dtype=np.uint8)
+            # {r, g, b} padded to full bytes, big-endian
+            n = (3*self.color_depth + 7) // 8
+            px = px[:len(px) - len(px) % n].reshape(-1, n)[self.h_back_porch_px:self.h_back_porch_px+self.w]
+            value = px[:, 0].astype(np.uint32)
+            for i in range(1, n):
+                value = (value << 8) | px[:, i]
+            row = self.framebuffer[self.frmb_y(self.y), :len(value)]
+            mask = (1 << self.color_depth) - 1
+            for i in range(3):
+                row[:, i] = self.adj_color((value >> ((2-i) * self.color_depth)) & mask)
+        self.hs_state = hs
+        if hs == self.low_active_hs_vs:
+            self.y += 1
+        if self.tracer is not None:
+            self.tracer("[LINE] HS -> %s, y <- %s", hs, self.y)
+
+    def adj_color(self, val):
+        return val << (8-self.color_depth)
+
+    def frmb_x(self, x):
+        return x-self.h_back_porch_px
+    
+    def frmb_y(self, y):
+        return y-self.v_back_porch_ln
+
+    def get_x(self, timestamps):
+        """ Vectorized get_delta_t(t, hs_timestamp) // time_per_pixel. """
+        delta = np.where(timestamps > self.hs_timestamp,
+                         timestamps - self.hs_timestamp,
+                         2**32 - self.hs_timestamp + timestamps)
+        return (delta // self.time_per_pixel).astype(np.int64)
+
+    def fill_row(self, x_start, x_end, colors):
+        """ Draw spans [x_start, x_end) of the current line in the given colors. """
+        if (self.y < self.v_back_porch_ln) or (self.y >= self.v_back_porch_ln + self.h):
+            return
+        x_start = self.frmb_x(np.clip(x_start, self.h_back_porch_px, self.h_back_porch_px+self.w))
+        x_end = self.frmb_x(np.clip(x_end, self.h_back_porch_px, self.h_back_porch_px+self.w))
+        visible = x_end > x_start
+        x_start, x_end, colors = x_start[visible], x_end[visible], colors[visible]
+        if not len(x_start):
+            return
+        row = self.framebuffer[self.frmb_y(self.y)]
+        if np.array_equal(x_start[1:], x_end[:-1]):
+            # common case: adjacent spans, write the row slice at once
+            row[x_start[0]:x_end[-1]] = np.repeat(colors, x_end - x_start, axis=0)
+        else:
+            for xs, xe, c in zip(x_start.tolist(), x_end.tolist(), colors):
+                row[xs:xe] = c
+
+    def update_framebuffer(self, rgb, timestamp):
+        if timestamp == self.fb_update_timestamp:
+            # zero-width span, e.g., a glitch
+            return
+        bounds = self.get_x(np.array([self.fb_update_timestamp, timestamp], dtype=np.int64))
+        self.fill_row(bounds[:1], bounds[1:], np.array([rgb], dtype=np.uint8))
+        self.fb_update_timestamp = timestamp
+
+
+    def get_image(self, live=False) -> Image.Image:
+        """ Image of the last completed frame, or of the framebuffer while it
+            is drawn if `live` is set or no frame completed yet. """
+        return self.to_image(self.framebuffer if (live or not self.frame_cnt) else self.frame)
+
+    def to_image(self, frame) -> Image.Image:
+        return self.scaler.get_image(frame)
+
+
+def add_vga_args(parser):
+    parser.add_argument("-d", "--depth", action="store", type=int, default=2, help="Color depth, i.e., number of bits per pixel")
+    parser.add_argument("-x", "--width", action="store", type=int, default=800, help="VGA screen width")
+    parser.add_argument("-y", "--height", action="store", type=int, default=600, help="VGA screen height")
+    parser.add_argument("-l", "--low-active", action="store_true", help="Make HS VS low active")
+    parser.add_argument("--h-front-porch", action="store", type=int, default=40, help="VGA horizontal front porch pixel")
+    parser.add_argument("--h-sync-pulse", action="store", type=int, default=128, help="VGA horizontal sync pulse pixel")
+    parser.add_argument("--h-back-porch", action="store", type=int, default=88, help="VGA horizontal back porch pixel")
+    parser.add_argument("--v-front-porch", action="store", type=int, default=1, help="VGA vertical front porch lines")
+    parser.add_argument("--v-sync-pulse", action="store", type=int, default=4, help="VGA vertical sync pulse lines")
+    parser.add_argument("--v-back-porch", action="store", type=int, default=23, help="VGA vertical back porch lines")
+
+def get_vga_settings(args) -> VGASetting:
+    return VGASetting(width=args.width, 
+                      height=args.height,
+                      h_front_porch_px=args.h_front_porch,
+                      h_sync_pulse_px=args.h_sync_pulse,
+                      h_back_porch_px=args.h_back_porch,
+                      v_front_porch_ln=args.v_front_porch,
+                      v_sync_pulse_ln=args.v_sync_pulse,
+                      v_back_porch_ln=args.v_back_porch,
+                      low_active_hs_vs=args.low_active,
+                      color_depth=args.depth)
@@ -8,19 +8,23 @@
 #
 
 import os
+import sys
 import tkinter as tk
-import socket
 import argparse
 import logging
 import json
-import threading
-import queue
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../.."))
+from simio.component import Component, add_client_args, get_client_kwargs
+from simio import log
 
 
 logger = logging.getLogger(__name__)
 
-class Gamepad(tk.Frame):
+class Gamepad(Component):
     SRV_PREFIX     = "[gamepad]-"
+    RECV_SIZE      = 4096
 
     KEY_DEFAULT_COLOR = "lightgray"
     KEY_ACTIVE_COLOR = "yellow"
@@ -28,17 +32,10 @@ class Gamepad(tk.Frame):
     MODE_CAPTURE = "capture (space)"
     MODE_TOGGLE = "toggle (space)"
 
-    def __init__(self, parent, socks_connect=False, addr=None, port=1000, *args, **kwargs):
-        tk.Frame.__init__(self, parent, *args, **kwargs)
-        self.parent = parent
-
-        self.parent.protocol("WM_DELETE_WINDOW", self.on_closing)
+    def __init__(self, parent, *args, **kwargs):
+        Component.__init__(self, parent, *args, **kwargs)
 
         self.mode = self.MODE_CAPTURE
-        self.rx_incomplete = ""
-        self.rx_queue = queue.Queue()
-        self.rx_thread = None
-        self.stop_event = threading.Event()
 
         self.main_frame = tk.Frame(self)
         self.main_frame.pack()
@@ -78,25 +75,14 @@ class Gamepad(tk.Frame):
         self.keys_map = {key: self.keys[key] for key in self.keys}        
         self.state_sensors = {key: False for key in self.keys_map}
         self.state_actors = {key: False for key in self.led_map}
+        # time the last key state was sent, for the key-to-LED latency
+        self.key_sent = None
+
+        self.connect()
 
-        self.sock = None
-        if socks_connect:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((addr, port))
-            logger.info(f"Connected to server: {addr}:{port}")
-            self.rx_thread = threading.Thread(target=self.recv_thread, args=(self.sock, self.rx_queue)).start()
-            self.recv_state()
- 
         self.parent.bind('<KeyPress>', self.handle_keydown)
         self.parent.bind('<KeyRelease>', self.handle_keyup)
 
-    def recv_thread(self, socket, queue):
-        if self.sock == None:
-            return
-        while not self.stop_event.is_set():
-            data = socket.recv(1024).decode('utf-8')
-            queue.put(data)
-
     def get_translated_sensor_state(self):
         translated = {}
         for key, value in self.state_sensors.items():
@@ -108,33 +94,27 @@ class Gamepad(tk.Frame):
         return translated
 
     def send_state(self):
-        dat = json.dumps(self.get_translated_sensor_state())
-        dat = "[gamepad]-" + dat + "\n"
-        dat = dat.encode()
-        logger.debug(f"[gamepad -> srv] {dat}")
-        if self.sock == None:
-            return
-        self.sock.sendall(dat)
-
-    def recv_state(self):
-        while not self.rx_queue.empty():
-            self.rx_incomplete += self.rx_queue.get()
-        
-        while "\n" in self.rx_incomplete:
-            tmp = self.rx_incomplete.split('\n', 1)
-            frame = tmp[0]
-            self.rx_incomplete = tmp[1]
-            self.handle_received(frame)
-        self.after(10, self.recv_state)
-
-
-    def handle_received(self, frame):
-        if not frame.startswith(Gamepad.SRV_PREFIX):
-            return
-        frame = frame.removeprefix(Gamepad.SRV_PREFIX)
-        logger.debug(f"[srv -> gamepad, frame] {frame}")
-        for key,value in json.loads(frame).items():
+        dat = self.get_translated_sensor_state()
+        logger.debug("[gamepad -> srv] %s", dat)
+        if self.latency is not None:
+            self.key_sent = time.time_ns()
+        self.send(dat)
+
+    def parse(self, lines):
+        return [json.loads(l) for l in lines]
+
+    def handle_batch(self, batch):
+        # only the latest state of each LED is shown
+        leds = {}
+        for msg in batch:
+            logger.debug("[srv -> gamepad, frame] %s", msg)
+            # other keys, e.g., the key state of another GUI, are ignored
+            leds.update({k: v for k, v in msg.items() if k in self.led_map})
+        for key,value in leds.items():
             self.led_map[key].config(bg=self.KEY_ACTIVE_COLOR if value else self.KEY_DEFAULT_COLOR)
+        if self.key_sent is not None:
+            self.latency.write({"key": self.key_sent, "led": time.time_ns()})
+            self.key_sent = None
 
     def handle_keydown(self, event):
         key = event.keysym
@@ -162,39 +142,23 @@ class Gamepad(tk.Frame):
             self.state_sensors[key] = False
             self.send_state()
 
-    def on_closing(self):
-        self.stop_event.set()
-        if self.sock:
-            self.sock.shutdown(2) # SHUT_RDWR
-        if self.rx_thread is not None:
-            self.rx_thread.join()
-        self.parent.destroy()
-
-def main(socks_connect, addr, port):
+def main(**client_kwargs):
     os.system('xset r off')
     root = tk.Tk()
     root.title("Gamepad")
-    Gamepad(root, socks_connect, addr, port).pack(side="top", fill="both", expand=True)
+    Gamepad(root, **client_kwargs).pack(side="top", fill="both", expand=True)
     root.mainloop()
     os.system('xset r on')
 
 def get_args():
     parser = argparse.ArgumentParser(description="DPI-C Verilog Model Gamepad")
-    parser.add_argument("-s", "--server", action="store_true", help="Connect to sockets server")
-    parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
-    parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
+    add_client_args(parser)
+    log.add_log_args(parser)
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = get_args()
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler("debug.log"),
-            logging.StreamHandler()
-        ]
-    )
-
-    main(args.server, args.address, args.port)
\ No newline at end of file
+    log.setup_logging(args)
+
+    main(**get_client_kwargs(args))
\ No newline at end of file
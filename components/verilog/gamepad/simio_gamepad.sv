@@ -14,6 +14,17 @@
 //  - key_left_o  Button LEFT pressed on gamepad.
 //  - key_a_o     Button A pressed on gamepad.
 //  - key_b_o     button B pressed on gamepad.
+//
+// Parameters
+//  - SOCK_ADDR   Server address.
+//  - POLL_CYCLES Clock cycles between two reads from the server while no
+//                key state is pending (default 1, a read on every clock).
+//                Raising it saves socket reads but adds latency: key
+//                changes reach key_*_o up to POLL_CYCLES clocks late.
+//                After a read returned a line, the next one follows on the
+//                next clock, so key states are applied one per clock in
+//                order and a press and release between two polls is not
+//                lost.
 // -----------------------------------------------------------------------------
 
 import sock::*;
@@ -21,7 +32,8 @@ import json::*;
 
 module gamepad
 #(
-  parameter SOCK_ADDR = "tcp://localhost:1080"
+  parameter SOCK_ADDR   = "tcp://localhost:1080",
+  parameter POLL_CYCLES = 1
 ) (
   input  logic clk_i,
 
@@ -42,6 +54,11 @@ module gamepad
   timeunit 1ns;
   chandle h;
   string  rd = "\n";
+  // last applied key state, unchanged states are not parsed again
+  string  last_rd = "";
+  int unsigned poll_cnt = 0;
+  // the last read returned a line, more may be pending
+  bit     got_line = 0;
   Object j = null;
   util::String s;
   int r;
@@ -64,13 +81,25 @@ module gamepad
 	    $stop();
     end
 
+    // only receive the gamepad GUI's messages
+    r = sock_writeln(h, {"[simio]-{\"subscribe\": [\"", SRV_PREFIX, "\"]}"});
+
     while (1) begin
       @(negedge clk_i);
       //#100
 
-      // receive
-      rd = sock_readln(h);
-      if ((rd != "") && (rd.substr(0, 9).compare(SRV_PREFIX) == 0)) begin
+      // receive, at most one socket read per clock: every POLL_CYCLES
+      // clocks and on every clock while lines arrive
+      rd = "";
+      if ((poll_cnt == 0) || got_line) begin
+        rd = sock_readln(h);
+        got_line = (rd != "");
+        poll_cnt = 0;
+      end
+      poll_cnt = (poll_cnt + 1 >= POLL_CYCLES) ? 0 : poll_cnt + 1;
+
+      if ((rd != "") && (rd.substr(0, 9).compare(SRV_PREFIX) == 0) && (rd != last_rd)) begin
+        last_rd = rd;
         s = new(rd.substr(10, rd.len()-1));
         j = json::LoadS(s);
         assert(j != null);
@@ -17,7 +17,12 @@
 //    COM Scan Direction:   C0/C8
 //  Addressing Setting:
 //    Set Addressing Mode:  20 + A[1:0]
+//    Set Column Address:   21 + A[6:0] + B[6:0]  (horizontal/vertical mode)
+//    Set Page Address:     22 + A[2:0] + B[2:0]  (horizontal/vertical mode)
+//    Set Column Start:     00-0F / 10-1F         (page mode)
+//    Set Page Start:       B0-B7                 (page mode)
 //
+//  The arguments of other multi-byte commands are skipped.
 //
 //  Deviations from datasheet:
 //    * Devices does _not_ start in page addressing mode
@@ -27,6 +32,17 @@
 //  - sdi_i       Serial data in.
 //  - sck_i       Serial clock.
 //  - dc_i        Data / command select.
+//
+// Parameters
+//  - BUFFERED    0: one message per data byte (default).
+//                1: consecutive data bytes of a page (or of a column in
+//                   vertical addressing mode) are collected and sent as one
+//                   burst message (hex encoded, with start column/row). The
+//                   burst is sent on a command, when the address jumps, when
+//                   chip select is released, or after FLUSH_NS without new
+//                   data.
+//  - FLUSH_NS    Idle time before a burst is sent, 0 to disable. The timer
+//                is a delay and needs timing support, e.g., --timing.
 // -----------------------------------------------------------------------------
 
 import sock::*;
@@ -34,7 +50,9 @@ import json::*;
 
 module simio_ssd1306_spi4
 #(
-  parameter SOCK_ADDR = "tcp://localhost:1080"
+  parameter SOCK_ADDR = "tcp://localhost:1080",
+  parameter BUFFERED  = 0,
+  parameter FLUSH_NS  = 100_000
 ) (
   input  logic cs_in,
   input  logic sdi_i,
@@ -89,15 +107,29 @@ module simio_ssd1306_spi4
   localparam DC_CMD_COM_DIR_REVERSE         = 9'h0_C8;
 
   localparam DC_CMD_ADR_MODE                = 9'h0_20;
+  localparam DC_CMD_COL_ADR                 = 9'h0_21;
+  localparam DC_CMD_PAGE_RANGE              = 9'h0_22;
 
   localparam DC_CMD_PAGE_ADR                = 9'h0_B?;
+  localparam DC_CMD_COL_START_LO            = 9'h0_0?;
+  localparam DC_CMD_COL_START_HI            = 9'h0_1?;
 
   // Display state
   enum int unsigned { ADR_HOR=0, ADR_VERT=1, ADR_PAGE=2, ADR_INVALID=3 } disp_adr_mode = ADR_PAGE;
 
+  // GRAM pointer, the row is the first row of the page
   int adr_pntr_col = 0;
   int adr_pntr_row = 0;
 
+  // Window of horizontal and vertical addressing mode
+  int win_col_start   = 0;
+  int win_col_end     = DISP_WIDTH-1;
+  int win_page_start  = 0;
+  int win_page_end    = DISP_HEIGHT/8-1;
+
+  // Column start of page addressing mode
+  bit [6:0] page_col_start = 0;
+
   initial begin
     const_false = new(0);
     const_true  = new(1);
@@ -112,9 +144,13 @@ module simio_ssd1306_spi4
       sock_shutdown();
 	    $stop();
     end
+
+    // the model never reads, do not receive anything
+    r = sock_writeln(h, "[simio]-{\"subscribe\": []}");
   end
 
 final begin
+	flush_burst;
 	sock_close(h);
 	sock_shutdown();
 end
@@ -124,9 +160,22 @@ logic [7:0] buffer;
 int         bitcnt = 0;
 int         bytecnt = 0;
 bit   [8:0] active_cmd = 0;
+int         argcnt = 0;
 
 logic       rx_frame_done;
 
+// Data bytes of the current burst, columns burst_x.. of the page at burst_y
+string      burst_data = "";
+int         burst_len  = 0;
+int         burst_x    = 0;
+int         burst_y    = 0;
+bit         burst_vert = 0;
+int         burst_next_x;
+int         burst_next_y;
+time        burst_time = 0;
+// Triggered by the first byte of a burst, starts the flush timer
+event       burst_started;
+
 assign rx_frame_done = (bitcnt == 8);
 
 always @(posedge sck_i) begin
@@ -144,6 +193,21 @@ always @(negedge sck_i) begin
   end
 end
 
+// end of transfer
+always @(posedge cs_in) flush_burst;
+
+if ((BUFFERED != 0) && (FLUSH_NS > 0)) begin : gen_flush_timer
+  // only waits while a burst is pending, an idle model schedules nothing
+  // and does not keep an event-driven simulation running
+  always begin
+    @(burst_started);
+    while (burst_len > 0) begin
+      #(burst_time + FLUSH_NS - $time);
+      if ((burst_len > 0) && ($time - burst_time >= FLUSH_NS)) flush_burst;
+    end
+  end
+end
+
 task send_data (input int x, input int y, input bit [7:0] data);
   // is this too inefficient? allocation statically
   j = new();
@@ -166,6 +230,54 @@ task send_data (input int x, input int y, input bit [7:0] data);
   r = sock_writeln(h, {SRV_PREFIX, s.get()});
 endtask
 
+task put_data (input int x, input int y, input bit [7:0] data, input bit vertical);
+  if (BUFFERED == 0) begin
+    send_data(x, y, data);
+    return;
+  end
+  // a burst covers consecutive columns of a page or pages of a column
+  if ((burst_len > 0) && ((vertical != burst_vert) || (x != burst_next_x) || (y != burst_next_y)))
+    flush_burst;
+  if (burst_len == 0) begin
+    burst_x     = x;
+    burst_y     = y;
+    burst_vert  = vertical;
+    burst_data  = "";
+  end
+  burst_data    = {burst_data, $sformatf("%02x", data)};
+  burst_len    += 1;
+  burst_time    = $time;
+  if (burst_len == 1) -> burst_started;
+  burst_next_x  = vertical ? x : x + 1;
+  burst_next_y  = vertical ? y + 8 : y;
+  if ((burst_next_x >= DISP_WIDTH) || (burst_next_y >= DISP_HEIGHT))
+    flush_burst;
+endtask
+
+task flush_burst;
+  if (burst_len == 0) return;
+  j = new();
+  s = new();
+
+  data_str  = new("burst");
+  j.append("type", data_str);
+
+  data_int  = new(burst_x);
+  j.append("x", data_int);
+
+  data_int  = new(burst_y);
+  j.append("y", data_int);
+
+  data_str  = new(burst_data);
+  j.append("data", data_str);
+
+  if (burst_vert) j.append("vertical", const_true);
+
+  j.dumpS(s);
+  r = sock_writeln(h, {SRV_PREFIX, s.get()});
+  burst_len = 0;
+endtask
+
 task send_cmd (input string key, input Object value);
   j = new();
   s = new();
@@ -188,6 +300,9 @@ begin
   spi_dat = buffer;
   spi_dc  = 1'b0;
 
+  // pending data is shown before the command takes effect
+  flush_burst;
+
   if ((~|active_cmd) && (bytecnt == 0)) begin
     casez({spi_dc, spi_dat})
       DC_CMD_DISP_ENTIRE_ON_DISABLE: send_cmd(SRV_ENTIRE_ON, const_false);
@@ -200,35 +315,79 @@ begin
       DC_CMD_SEG_REMAP_INVERSE:      send_cmd(SRV_FLIP_HOR, const_true);
       DC_CMD_COM_DIR_DEFAULT:        send_cmd(SRV_FLIP_VERT, const_false);
       DC_CMD_COM_DIR_REVERSE:        send_cmd(SRV_FLIP_VERT, const_true);
+      // only for page addressing mode, ignored in the 21h/22h window
       DC_CMD_PAGE_ADR: begin
-        adr_pntr_col = 0;
-        adr_pntr_row = {25'b0, spi_dat[3:0], 3'b000};
+        if (disp_adr_mode == ADR_PAGE)
+          adr_pntr_row = {26'b0, spi_dat[2:0], 3'b000};
       end
-      DC_CMD_ADR_MODE: begin
-        active_cmd  = DC_CMD_ADR_MODE;
-        bytecnt     = 'd1;
+      DC_CMD_COL_START_LO: begin
+        if (disp_adr_mode == ADR_PAGE) begin
+          page_col_start  = {page_col_start[6:4], spi_dat[3:0]};
+          adr_pntr_col    = page_col_start;
+        end
+      end
+      DC_CMD_COL_START_HI: begin
+        if (disp_adr_mode == ADR_PAGE) begin
+          page_col_start  = {spi_dat[2:0], page_col_start[3:0]};
+          adr_pntr_col    = page_col_start;
+        end
       end
+      DC_CMD_ADR_MODE:      start_args(1);
+      DC_CMD_COL_ADR:       start_args(2);
+      DC_CMD_PAGE_RANGE:    start_args(2);
+      // unsupported commands with arguments
+      9'h0_81, 9'h0_8D, 9'h0_A8, 9'h0_D3,
+      9'h0_D5, 9'h0_D9, 9'h0_DA, 9'h0_DB:   start_args(1);
+      9'h0_A3:                              start_args(2);
+      9'h0_29, 9'h0_2A:                     start_args(5);
+      9'h0_26, 9'h0_27:                     start_args(6);
       default: begin end
     endcase
   end
   else begin
-    // --- DC_CMD_ADR_MODE ---
-    if ((active_cmd == DC_CMD_ADR_MODE) && (bytecnt == 1)) begin
-      bytecnt     = 0;
+    argcnt  += 1;
+    bytecnt -= 1;
+    case (active_cmd)
+      DC_CMD_ADR_MODE: begin
+        case (spi_dat[1:0])
+          2'b00: disp_adr_mode = ADR_HOR;
+          2'b01: disp_adr_mode = ADR_VERT;
+          2'b10: disp_adr_mode = ADR_PAGE;
+          2'b11: disp_adr_mode = ADR_INVALID;
+        endcase
+      end
+      DC_CMD_COL_ADR: begin
+        if (argcnt == 1) begin
+          win_col_start = int'(spi_dat[6:0]);
+        end else begin
+          win_col_end   = int'(spi_dat[6:0]);
+          adr_pntr_col  = win_col_start;
+        end
+      end
+      DC_CMD_PAGE_RANGE: begin
+        if (argcnt == 1) begin
+          win_page_start  = int'(spi_dat[2:0]);
+        end else begin
+          win_page_end    = int'(spi_dat[2:0]);
+          adr_pntr_row    = 8*win_page_start;
+        end
+      end
+      default: begin end
+    endcase
+    if (bytecnt == 0) begin
       active_cmd  = 'b0;
-      case (spi_dat[1:0])
-        2'b00: disp_adr_mode = ADR_HOR;
-        2'b01: disp_adr_mode = ADR_VERT;
-        2'b10: disp_adr_mode = ADR_PAGE;
-        2'b11: disp_adr_mode = ADR_INVALID;
-      endcase
+      argcnt      = 0;
     end
-    // ---  ---
-
   end
 end
 endtask
 
+task start_args (input int n);
+  active_cmd  = {spi_dc, spi_dat};
+  bytecnt     = n;
+  argcnt      = 0;
+endtask
+
 task spi_action_data;
 begin
   spi_dat = buffer;
@@ -236,26 +395,27 @@ begin
 
   case(disp_adr_mode)
   ADR_HOR: begin
-    send_data(adr_pntr_col, adr_pntr_row, spi_dat);
-    if (adr_pntr_col == (DISP_WIDTH-1)) begin
-      adr_pntr_col = 0;
-      if (adr_pntr_row == (DISP_HEIGHT-8)) begin
-        adr_pntr_row = 0;
-      end else begin
-        adr_pntr_row += 8;
-      end
+    put_data(adr_pntr_col, adr_pntr_row, spi_dat, 1'b0);
+    if (adr_pntr_col >= win_col_end) begin
+      adr_pntr_col = win_col_start;
+      adr_pntr_row = (adr_pntr_row >= 8*win_page_end) ? 8*win_page_start : adr_pntr_row + 8;
     end else begin
       adr_pntr_col += 1;
     end
   end
-  ADR_PAGE: begin
-    send_data(adr_pntr_col, adr_pntr_row, spi_dat);
-    if (adr_pntr_col == (DISP_WIDTH-1)) begin
-      adr_pntr_col = 0;
+  ADR_VERT: begin
+    put_data(adr_pntr_col, adr_pntr_row, spi_dat, 1'b1);
+    if (adr_pntr_row >= 8*win_page_end) begin
+      adr_pntr_row = 8*win_page_start;
+      adr_pntr_col = (adr_pntr_col >= win_col_end) ? win_col_start : adr_pntr_col + 1;
     end else begin
-      adr_pntr_col += 1;
+      adr_pntr_row += 8;
     end
   end
+  ADR_PAGE: begin
+    put_data(adr_pntr_col, adr_pntr_row, spi_dat, 1'b0);
+    adr_pntr_col = (adr_pntr_col == (DISP_WIDTH-1)) ? int'(page_col_start) : adr_pntr_col + 1;
+  end
   default: begin
     adr_pntr_col = 0;
     adr_pntr_row = 0;
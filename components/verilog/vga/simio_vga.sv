@@ -11,6 +11,37 @@
 //  - b_i   VGA blue.
 //  - hs_i  Horizontal sync.
 //  - vs_i  Vertical sync.
+//  - clk_i Pixel clock, optional. Only used with WIRE_FORMAT "line" and
+//          COALESCE "clk", may be left unconnected otherwise.
+//
+// Parameters
+//  - WIRE_FORMAT "json": one JSON object per event (default).
+//                "bin":  fixed-size records '#' + hex(type, timestamp, r, g, b),
+//                        avoids allocating JSON objects on every edge.
+//                "line": the pixels sampled on every clk_i since the last
+//                        HSync edge are sent as one message at the next
+//                        HSync edge, VSync edges as JSON objects. One
+//                        message per line instead of per color change.
+//  - MAX_LINE_PX Maximum pixels between two HSync edges in "line" mode.
+//  - COALESCE    RGB changes sent with WIRE_FORMAT "json" or "bin":
+//                "none": every change, including combinational glitches
+//                        (default).
+//                "step": the value settled one time unit after a change,
+//                        with the time of the change. Changes during that
+//                        time unit do not restart the wait, they are part
+//                        of the settled value. Needs timing support, e.g.,
+//                        Verilator --timing.
+//                "clk":  the value on every clk_i edge it differs from the
+//                        last sent one.
+//                With "step" and "clk", a value equal to the last sent one
+//                is not sent.
+//
+// Frame skipping
+//  The GUI sends [displayvga-ctl]-{"skip": n, "pause": 0|1}, read once per
+//  frame on the rising VSync edge. Both keys are optional and found
+//  independently, without the JSON library. Of every n+1 frames, only the first one
+//  is sent, no frame while paused. RGB and HSync events of skipped frames
+//  are suppressed, VSync edges are always sent.
 // -----------------------------------------------------------------------------
 
 import sock::*;
@@ -19,17 +50,32 @@ import json::*;
 module simio_vga
 #(
   parameter RGB_DEPTH = 2,
-  parameter SOCK_ADDR = "tcp://localhost:1080"
+  parameter SOCK_ADDR = "tcp://localhost:1080",
+  parameter WIRE_FORMAT = "json",
+  parameter MAX_LINE_PX = 2048,
+  parameter COALESCE    = "none"
 ) (
   input  logic [RGB_DEPTH-1:0] r_i,
   input  logic [RGB_DEPTH-1:0] g_i,
   input  logic [RGB_DEPTH-1:0] b_i,
   input  logic hs_i,
-  input  logic vs_i
+  input  logic vs_i,
+  // last and with a default, existing instantiations stay valid
+  input  logic clk_i = 1'b0
 );
   
 // Server commands
 string SRV_PREFIX     = "[displayvga]-";
+string CTL_PREFIX     = "[displayvga-ctl]-";
+
+// Binary record types
+localparam bit [7:0] REC_RGB  = 8'd0;
+localparam bit [7:0] REC_HS   = 8'd1;
+localparam bit [7:0] REC_VS   = 8'd2;
+
+// Line mode: hex digits per pixel, {r, g, b} padded to full bytes
+localparam PX_DIGITS = 2*((3*RGB_DEPTH+7)/8);
+localparam string HEX_DIGITS = "0123456789abcdef";
 
 timeunit 1ns;
 chandle h;
@@ -39,6 +85,25 @@ util::String s;
 json::String data_str;
 int r;
 
+// Line mode: hex encoded pixels since the last HSync edge, preallocated
+// and written in place
+string line_hex = {MAX_LINE_PX*PX_DIGITS{"0"}};
+int unsigned line_px = 0;
+logic hs_r = 1'b0;
+bit [4*PX_DIGITS-1:0] px;
+
+// Last sent and settling RGB value, see COALESCE
+bit [3*RGB_DEPTH-1:0] rgb_sent = '0;
+int unsigned rgb_time;
+
+// Frame skipping, latest control message
+int unsigned skip_n = 0;
+int unsigned pause = 0;
+int unsigned frame_cnt = 0;
+bit suppress = 1'b0;
+string ctl_line;
+string ctl_rd;
+
 initial begin
   if (sock_init() < 0) begin
     $fatal("[Error] Cannot init library.");
@@ -49,18 +114,121 @@ initial begin
     sock_shutdown();
     $stop();
   end
+  // only receive the frame skipping control messages
+  r = sock_writeln(h, {"[simio]-{\"subscribe\": [\"", CTL_PREFIX, "\"]}"});
 end
 
 // Send data on any change and let the python handle
 // any computations
-always @({r_i, g_i, b_i})
-  send_rgb(r_i, g_i, b_i);
+if (COALESCE == "step") begin : gen_rgb_step
+  // the delay is only elaborated if used, "none" builds without --timing
+  always @({r_i, g_i, b_i})
+    if ((WIRE_FORMAT != "line") && !suppress) begin
+      rgb_time = $stime;
+      // further changes while waiting do not re-trigger, only the settled
+      // value is sent
+      #1;
+      if ({r_i, g_i, b_i} != rgb_sent) send_rgb_change(rgb_time);
+    end
+end else if (COALESCE == "none") begin : gen_rgb_none
+  always @({r_i, g_i, b_i})
+    if ((WIRE_FORMAT != "line") && !suppress) send_rgb_change($stime);
+end
+
+always @(posedge clk_i)
+  if ((WIRE_FORMAT != "line") && (COALESCE == "clk") && !suppress && ({r_i, g_i, b_i} != rgb_sent))
+    send_rgb_change($stime);
 
 always @(hs_i)
-  send_hs_vs("hs", hs_i);
+  if (!suppress) begin
+    if (WIRE_FORMAT == "bin")       send_record(REC_HS, $stime, {7'b0, hs_i}, 8'b0, 8'b0);
+    else if (WIRE_FORMAT == "json") send_hs_vs("hs", hs_i);
+  end
 
 always @(vs_i)
-  send_hs_vs("vs", vs_i);
+  if (WIRE_FORMAT == "bin") send_record(REC_VS, $stime, {7'b0, vs_i}, 8'b0, 8'b0);
+  else                      send_hs_vs("vs", vs_i);
+
+// a socket read per frame, no JSON parsing
+always @(posedge vs_i) begin
+  read_ctl();
+  suppress = (pause != 0) || ((frame_cnt % (skip_n + 1)) != 0);
+  frame_cnt++;
+  // the color may have changed while skipped
+  if (!suppress && (WIRE_FORMAT != "line") && ({r_i, g_i, b_i} != rgb_sent)) send_rgb_change($stime);
+end
+
+
+always @(posedge clk_i)
+  if (WIRE_FORMAT == "line") begin
+    if (hs_i != hs_r) begin
+      if (!suppress) send_line(hs_i);
+      line_px = 0;
+    end
+    hs_r = hs_i;
+    if (line_px < MAX_LINE_PX) begin
+      px = {r_i, g_i, b_i};
+      for (int i = 0; i < PX_DIGITS; i++)
+        line_hex.putc(line_px*PX_DIGITS + i, HEX_DIGITS[px[4*(PX_DIGITS-1-i) +: 4]]);
+      line_px++;
+    end
+  end
+
+
+task read_ctl;
+  int unsigned n;
+  int unsigned p;
+  // only the latest message matters
+  ctl_rd = "";
+  ctl_line = sock_readln(h);
+  while (ctl_line != "") begin
+    if (ctl_line.substr(0, CTL_PREFIX.len()-1).compare(CTL_PREFIX) == 0) ctl_rd = ctl_line;
+    ctl_line = sock_readln(h);
+  end
+  if (ctl_rd != "") begin
+    ctl_rd = ctl_rd.substr(CTL_PREFIX.len(), ctl_rd.len()-1);
+    if (get_json_int(ctl_rd, "skip", n))  skip_n = n;
+    if (get_json_int(ctl_rd, "pause", p)) pause = p;
+  end
+endtask
+
+
+// Integer value of `key` in a flat JSON object, independent of the key
+// order and whitespace. Returns 0 if the key or its value is missing.
+function automatic bit get_json_int (input string msg, input string key, output int unsigned val);
+  string k = {"\"", key, "\""};
+  for (int i = 0; i + k.len() <= msg.len(); i++)
+    if (msg.substr(i, i + k.len() - 1) == k) begin
+      for (int c = i + k.len(); c < msg.len(); c++)
+        if (msg[c] == ":") return $sscanf(msg.substr(c + 1, msg.len() - 1), "%d", val) == 1;
+      return 0;
+    end
+  return 0;
+endfunction
+
+
+task send_line (input bit val);
+  // built as string, a JSON object per line would copy the pixels twice
+  r = sock_writeln(h, {SRV_PREFIX, $sformatf("{\"type\":\"line\",\"timestamp\":%0d,\"value\":%0d,\"data\":\"", $stime, val),
+                       line_hex.substr(0, line_px*PX_DIGITS-1), "\"}"});
+endtask
+
+
+task send_rgb_change (input int unsigned t);
+  rgb_sent = {r_i, g_i, b_i};
+  if (WIRE_FORMAT == "bin") send_record(REC_RGB, t, 8'(r_i), 8'(g_i), 8'(b_i));
+  else                      send_rgb(t, r_i, g_i, b_i);
+endtask
+
+
+task send_record (input bit [7:0] rtype,
+                  input int unsigned t,
+                  input bit [7:0] v0,
+                  input bit [7:0] v1,
+                  input bit [7:0] v2);
+  // hex encoded to be line- and string-safe, no allocations
+  r = sock_writeln(h, {SRV_PREFIX, $sformatf("#%02x%08x%02x%02x%02x", rtype, t, v0, v1, v2)});
+endtask
 
 
 task send_hs_vs (input string hs_vs, input bit val);
@@ -82,7 +250,8 @@ task send_hs_vs (input string hs_vs, input bit val);
 endtask
 
 
-task send_rgb (input bit [RGB_DEPTH-1:0] cr,
+task send_rgb (input int unsigned t,
+              input bit [RGB_DEPTH-1:0] cr,
               input bit [RGB_DEPTH-1:0] cg,
               input bit [RGB_DEPTH-1:0] cb);
   // is this too inefficient? allocation statically
@@ -92,7 +261,7 @@ task send_rgb (input bit [RGB_DEPTH-1:0] cr,
   data_str  = new("rgb");
   j.append("type", data_str);
 
-  data_int  = new($stime);
+  data_int  = new(t);
   j.append("timestamp", data_int);
 
   data_int  = new({{32-RGB_DEPTH{1'b0}}, cr});
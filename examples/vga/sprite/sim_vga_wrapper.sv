@@ -21,6 +21,7 @@ logic hs;
 logic vs;
 
 simio_vga i_simio_vga (
+  .clk_i ( clk_i ),
   .r_i  ( r   ),
   .g_i  ( g   ),
   .b_i  ( b   ),
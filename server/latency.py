@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     latency.py
+# Usage:    Report the latency per stage recorded by the GUIs with
+#           --latency, see simio/latency.py for the stages.
+#
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simio.latency import STAGES, get_stages
+
+# Histogram bins [ms], the last one is open
+BINS_MS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000)
+BAR_WIDTH = 40
+
+
+def load(paths):
+    """ Stage name -> durations [s] of all records in `paths`. """
+    stages = {name: [] for name in STAGES}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                for name, t in get_stages(json.loads(line)).items():
+                    stages[name].append(t)
+    return {name: np.array(t) for name, t in stages.items() if t}
+
+def print_histogram(t_ms):
+    counts = np.bincount(np.searchsorted(BINS_MS, t_ms, side="right"), minlength=len(BINS_MS)+1)
+    used = counts.nonzero()[0]
+    for i in range(used[0], used[-1]+1):
+        label = f"< {BINS_MS[i]:g} ms" if i < len(BINS_MS) else f">= {BINS_MS[-1]:g} ms"
+        bar = "#" * int(round(BAR_WIDTH * counts[i] / counts.max()))
+        print(f"  {label:>12} {counts[i]:>8} {bar}")
+
+
+def main(args):
+    stages = load(args.files)
+    if not stages:
+        print("No records")
+        return
+    report = {}
+    for name, t in stages.items():
+        t_ms = t * 1e3
+        report[name] = {
+            "count": len(t_ms),
+            "mean_ms": float(t_ms.mean()),
+            "p50_ms": float(np.percentile(t_ms, 50)),
+            "p90_ms": float(np.percentile(t_ms, 90)),
+            "p99_ms": float(np.percentile(t_ms, 99)),
+            "max_ms": float(t_ms.max()),
+        }
+        if args.json:
+            continue
+        r = report[name]
+        print(f"{name}: {r['count']} batches, mean {r['mean_ms']:.3f} ms, p50 {r['p50_ms']:.3f} ms, "
+              f"p90 {r['p90_ms']:.3f} ms, p99 {r['p99_ms']:.3f} ms, max {r['max_ms']:.3f} ms")
+        print_histogram(t_ms)
+    if args.json:
+        print(json.dumps(report))
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Latency report of SimIO GUIs run with --latency")
+    parser.add_argument("files", nargs="+", help="Files written with --latency")
+    parser.add_argument("-j", "--json", action="store_true", help="Print the statistics as JSON, without histograms")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(get_args())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     replay.py
+# Usage:    Stream a trace recorded by the server (--record) back to the
+#           server, e.g., to debug a GUI without re-running the simulation.
+#
+
+import os
+import sys
+import time
+import argparse
+import logging
+from tracefile import TraceReader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simio import transport
+from simio import log
+
+logger = logging.getLogger(__name__)
+
+# Records are coalesced into writes of this size at maximum speed
+CHUNK_SIZE = 1024*1024
+
+def replay(trace, sock, offset, line=0, realtime=False, speed=1.0):
+    chunk = []
+    chunk_size = 0
+    t_start = None
+    wall_start = time.monotonic()
+    for t, _, data in trace.records(offset, line):
+        if realtime:
+            if t_start is None:
+                t_start = t
+            delay = (t - t_start) / 1e9 / speed - (time.monotonic() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+            sock.sendall(data)
+            continue
+        chunk.append(data)
+        chunk_size += len(data)
+        if chunk_size >= CHUNK_SIZE:
+            sock.sendall(b"".join(chunk))
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        sock.sendall(b"".join(chunk))
+
+
+def main(args):
+    trace = TraceReader(args.trace_file)
+    vsync_level = 1 if args.low_active else 0
+    if args.info:
+        print(f"duration: {trace.get_duration()/1e9:.3f} s")
+        print(f"frames:   {trace.get_frame_cnt(vsync_level)}")
+        trace.close()
+        return
+
+    line = 0
+    offset = trace.seek_time(int(args.time * 1e9))
+    if args.frame is not None:
+        offset, line = trace.seek_frame(args.frame, vsync_level)
+
+    sock = transport.connect(args.address, args.port, unix=args.unix)
+    logger.info(f"Connected to server: {args.unix or f'{args.address}:{args.port}'}")
+    # only send, do not receive anything
+    sock.subscribe([])
+    try:
+        replay(trace, sock, offset, line, realtime=args.realtime, speed=args.speed)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        trace.close()
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Replay a SimIO server trace")
+    parser.add_argument("trace_file", metavar="trace", help="Trace file recorded with server.py --record")
+    parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
+    parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
+    parser.add_argument("-u", "--unix", action="store", type=str, default=None, help="Connect to the server's Unix domain socket at this path instead of TCP")
+    parser.add_argument("-f", "--frame", action="store", type=int, default=None, help="Start at the n-th VGA frame (end of VSync pulse)")
+    parser.add_argument("-l", "--low-active", action="store_true", help="VSync is low active, see gui_display_vga.py")
+    parser.add_argument("-t", "--time", action="store", type=float, default=0.0, help="Start at this time [s] of the recording")
+    parser.add_argument("-R", "--realtime", action="store_true", help="Replay at the recorded pace instead of maximum speed")
+    parser.add_argument("-s", "--speed", action="store", type=float, default=1.0, help="Speed factor for --realtime")
+    parser.add_argument("-i", "--info", action="store_true", help="Print information about the trace and exit")
+    log.add_log_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    log.setup_logging(args)
+
+    main(args)
@@ -8,59 +8,743 @@
 #           SystemVerilog simulation.
 #
 
+import os
+import sys
+import time
 import socket
+import selectors
 import argparse
 import logging
-import threading
+import json
+import re
+from collections import deque
+from tracefile import TraceWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simio.shm import ShmRing, OFS_WAITING, OFS_FULL
+from simio.transport import DOORBELL, SHM_ATTACHED
+from simio import log
 
 logger = logging.getLogger(__name__)
 
+# Lines with this prefix are addressed to the server itself, e.g.,
+#   [simio]-{"subscribe": ["[gamepad]-"]}
+CTRL_PREFIX = b"[simio]-"
+
+# Maximum number of buffers passed to a single sendmsg()
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+# Backpressure policies applied when a client's queue is full
+POLICY_BLOCK        = "block"
+POLICY_DROP_OLDEST  = "drop-oldest"
+POLICY_COALESCE     = "coalesce"
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE)
+
+# Prefixes whose latest state is sent to new subscribers, see StateCache
+SNAPSHOT_PREFIXES = ("[displaybw]-", "[gamepad]-", "[displayvga-ctl]-")
+
+TYPE_RE = re.compile(rb'"type"\s*:\s*"([^"]*)"')
+
+def get_prefix(data, start=0):
+    """ Return the component prefix '[name]-' of the line starting at `start`. """
+    if data[start:start+1] != b"[":
+        return b""
+    end = data.find(b"]-", start, data.find(b"\n", start))
+    return bytes(data[start:end+2]) if end >= 0 else b""
+
+def get_state_key(line):
+    """ Return the key of a state message, e.g., gamepad LEDs or display
+        commands, of which only the latest one matters. None for stream
+        messages, e.g., pixel data. """
+    prefix = get_prefix(line)
+    body = line[len(prefix):]
+    if not body.startswith(b"{"):
+        return None
+    m = TYPE_RE.search(body)
+    if m and m.group(1) != b"cmd":
+        return None
+    try:
+        return (prefix, tuple(k for k in json.loads(body) if k != "type"))
+    except ValueError:
+        return None
+
+
+class StateCache:
+    """ Latest state one client sent with one prefix: the last line per
+        state key (see get_state_key()) and, for the SSD1306, the GRAM
+        rebuilt from its data and burst messages. Received lines are only
+        logged; they are parsed once a snapshot is requested or the log
+        exceeds MAX_LOG, newest first, so that GRAM writes overwritten
+        later, e.g., by redraws, are skipped without parsing them. Memory
+        is bounded by MAX_LOG, MAX_KEYS lines of at most MAX_LINE bytes and
+        the fixed GRAM. """
+    MAX_LOG     = 1024*1024
+    MAX_KEYS    = 64
+    MAX_LINE    = 4096
+    GRAM_PREFIX = b"[displaybw]-"
+    GRAM_W      = 128
+    GRAM_PAGES  = 8
+
+    def __init__(self, prefix) -> None:
+        self.prefix = prefix
+        # state key -> line, the latest updated last
+        self.lines = {}
+        self.gram = bytearray(self.GRAM_W * self.GRAM_PAGES) if prefix == self.GRAM_PREFIX else None
+        # pages written so far, others are sent as they are
+        self.pages = set()
+        # received runs of lines not applied yet
+        self.log = []
+        self.log_bytes = 0
+
+    def update(self, data):
+        """ Log complete lines with this cache's prefix. """
+        self.log.append(data)
+        self.log_bytes += len(data)
+        if self.log_bytes > self.MAX_LOG:
+            self.fold()
+
+    def fold(self):
+        """ Apply the logged lines, newest first. Untyped and "cmd" messages
+            are state, like in get_state_key(). """
+        log = self.log
+        self.log = []
+        self.log_bytes = 0
+        n = len(self.prefix)
+        # state key -> line, the latest first
+        latest = {}
+        # GRAM cells written by a newer message than the current one
+        written = bytearray(len(self.gram)) if self.gram is not None else None
+        left = len(self.gram) if self.gram is not None else 0
+        for data in reversed(log):
+            # once the GRAM is complete, runs of typed, non-"cmd" lines
+            # cannot change the state
+            if not left and (b'"cmd"' not in data) and (len(TYPE_RE.findall(data)) == data.count(b"\n")):
+                continue
+            for line in reversed(data.split(b"\n")[:-1]):
+                if not line.startswith(b"{", n):
+                    continue
+                m = TYPE_RE.search(line, n)
+                rtype = m.group(1) if m else None
+                if (rtype not in (None, b"cmd")) and not left:
+                    continue
+                try:
+                    msg = json.loads(line[n:])
+                except ValueError:
+                    continue
+                if not isinstance(msg, dict):
+                    continue
+                if rtype in (None, b"cmd"):
+                    key = tuple(k for k in msg if k != "type")
+                    if (key not in latest) and (len(line) < self.MAX_LINE):
+                        latest[key] = line + b"\n"
+                elif self.gram is not None:
+                    left -= self.update_gram(msg, written)
+        for key, line in reversed(latest.items()):
+            self.lines.pop(key, None)
+            if len(self.lines) < self.MAX_KEYS:
+                self.lines[key] = line
+
+    def update_gram(self, msg, written):
+        """ Apply a data or burst message to the cells not in `written`,
+            return the number of cells written. """
+        try:
+            if msg["type"] == "data":
+                return self.write(msg["x"], msg["y"] // 8, bytes([msg["data"] & 0xff]), written)
+            elif msg["type"] == "burst":
+                return self.write(msg["x"], msg["y"] // 8, bytes.fromhex(msg["data"]), written, msg.get("vertical", False))
+        except (ValueError, KeyError, TypeError):
+            pass
+        return 0
+
+    def write(self, x, page, data, written, vertical=False):
+        if not ((0 <= x < self.GRAM_W) and (0 <= page < self.GRAM_PAGES)):
+            return 0
+        if vertical:
+            cells = range(page*self.GRAM_W + x, self.GRAM_PAGES*self.GRAM_W, self.GRAM_W)
+        else:
+            cells = range(page*self.GRAM_W + x, (page+1)*self.GRAM_W)
+        cnt = 0
+        for i, b in zip(cells, data):
+            if not written[i]:
+                written[i] = 1
+                self.gram[i] = b
+                self.pages.add(i // self.GRAM_W)
+                cnt += 1
+        return cnt
+
+    def snapshot(self):
+        """ Lines restoring the state, GRAM pages as bursts first. """
+        self.fold()
+        lines = [self.prefix + b'{"type": "burst", "x": 0, "y": %d, "data": "%s"}\n' %
+                 (8*p, self.gram[p*self.GRAM_W:(p+1)*self.GRAM_W].hex().encode()) for p in sorted(self.pages)]
+        return b"".join(lines + list(self.lines.values()))
+
+
+class Client:
+    def __init__(self, sock, addr) -> None:
+        self.sock = sock
+        self.addr = addr
+        # Incomplete line received last
+        self.rbuf = bytearray()
+        # Pending outbound frames, written with a single sendmsg() once the
+        # flush condition is met and the socket is writable
+        self.wq = deque()
+        self.wq_bytes = 0
+        self.wq_since = 0.0
+        self.want_write = False
+        # The shared-memory ring did not take all data, set until the
+        # client sends a drained command
+        self.ring_full = False
+        self.events = selectors.EVENT_READ
+        # Block policy: producers paused by this client's full queue and
+        # the clients whose full queues pause this one
+        self.blocking = set()
+        self.paused_by = set()
+        # Number of lines dropped or replaced by newer state
+        self.dropped = 0
+        self.coalesced = 0
+        # Subscribed prefixes; None receives everything (no handshake)
+        self.subscriptions = None
+        self.last_prefix = b""
+        # Shared-memory ring the client receives from instead of the socket
+        self.ring = None
+        # Ring attached but not used until `handshake`, the rest of a frame
+        # begun on the socket and the attached marker, was written
+        self.ring_pending = None
+        self.handshake = b""
+        # Statistics, see Server.get_stats()
+        self.connected = time.monotonic()
+        self.lines_in = 0
+        self.bytes_in = 0
+        self.lines_out = 0
+        self.bytes_out = 0
+        # Time paused by the block policy and with data the socket or ring
+        # did not take; *_since is set while it lasts
+        self.paused_s = 0.0
+        self.paused_since = None
+        self.stalled_s = 0.0
+        self.stalled_since = None
+        # Interleave receive and forward time stamps, see simio/latency.py
+        self.stamps = False
+        # The queued data has a forward stamp, set until the queue drained
+        self.fwd_stamped = False
+        # prefix -> StateCache of the state this client sent, dropped with
+        # the client so that a restarted simulation starts clean
+        self.state = {}
+
+    def get_stats(self, now):
+        return {
+            "addr": str(self.addr),
+            "subscriptions": None if self.subscriptions is None else sorted(p.decode() for p in self.subscriptions),
+            "shm": self.ring is not None,
+            "connected_s": now - self.connected,
+            "lines_in": self.lines_in,
+            "bytes_in": self.bytes_in,
+            "lines_out": self.lines_out,
+            "bytes_out": self.bytes_out,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "queue_bytes": self.wq_bytes,
+            "paused_s": self.paused_s + (now - self.paused_since if self.paused_since is not None else 0.0),
+            "stalled_s": self.stalled_s + (now - self.stalled_since if self.stalled_since is not None else 0.0),
+        }
+
+
 class Server:
-    def __init__(self, addr, port, nmax) -> None:
-        self.clients = []
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    RECV_SIZE = 256*1024
+    # Longest line a client may send, e.g., a VGA line of MAX_LINE_PX pixels
+    MAX_LINE  = 1024*1024
+
+    def __init__(self, addr, port, nmax, flush_size=0, flush_interval=0.0,
+                 queue_size=16*1024*1024, policy=POLICY_BLOCK, record=None, unix=None,
+                 snapshot=SNAPSHOT_PREFIXES) -> None:
+        assert policy in POLICIES, f"Unknown policy: {policy}"
+        self.clients = {}
+        # Append all routed lines to this trace file
+        self.trace = TraceWriter(record) if record else None
+        # Pending bytes per client before `policy` is applied
+        self.queue_size = queue_size
+        self.policy = policy
+        # Outbound data is held back until a client has `flush_size` bytes
+        # pending or the oldest pending frame is `flush_interval` s old.
+        # Without an interval, data is never held back, so that it cannot
+        # be held forever.
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        if flush_size and not flush_interval:
+            logger.warning("--flush-size has no effect without --flush-interval")
+        # clients with pending outbound frames
+        self.pending = set()
+        # prefix -> set of subscribed clients
+        self.index = {}
+        # clients without subscription handshake
+        self.broadcast = set()
+        # prefix -> subscribers, rebuilt after subscription changes
+        self.routes = {}
+        # New subscribers of these prefixes first receive the latest state
+        self.snapshot = {p.encode() for p in snapshot}
+        # prefix -> [lines, bytes] forwarded
+        self.prefix_stats = {}
+        self.started = time.monotonic()
+        # Sampled logging of received data, None unless --trace is given
+        self.tracer = log.get_tracer(logger)
+        self.sel = selectors.DefaultSelector()
+        self.listeners = []
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         logger.info(f"Starting server {addr}:{port} ...")
-        self.sock.bind((addr, port))
-        self.sock.listen(nmax)
+        sock.bind((addr, port))
+        self.listen(sock, nmax)
+        # Local clients can skip the TCP stack
+        self.unix = unix
+        if unix:
+            if os.path.exists(unix):
+                os.unlink(unix)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            logger.info(f"Listening on {unix} ...")
+            sock.bind(unix)
+            self.listen(sock, nmax)
+
+    def listen(self, sock, nmax):
+        sock.listen(nmax)
+        sock.setblocking(False)
+        self.sel.register(sock, selectors.EVENT_READ, None)
+        self.listeners.append(sock)
 
     def run(self):
         try:
             while True:
-                client_socket, client_addr = self.sock.accept()
-                self.clients.append(client_socket)
-
-                client_thread = threading.Thread(target=self.handle_client, args=(client_socket, client_addr, self.clients))
-                client_thread.start()
+                for key, mask in self.sel.select(self.get_timeout()):
+                    if key.data is None:
+                        self.accept(key.fileobj)
+                        continue
+                    client = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.handle_read(client)
+                    if (mask & selectors.EVENT_WRITE) and (client.sock.fileno() >= 0):
+                        self.flush(client)
+                self.flush_pending()
         except KeyboardInterrupt:
             logger.info("Shutting down server")
-            self.sock.close()
+        finally:
+            for client in list(self.clients.values()):
+                self.disconnect(client)
+            self.sel.close()
+            for sock in self.listeners:
+                sock.close()
+            if self.unix:
+                os.unlink(self.unix)
+            if self.trace is not None:
+                self.trace.close()
 
-    def handle_client(self, client_socket, client_addr, clients):
+    def accept(self, sock):
+        client_socket, client_addr = sock.accept()
+        client_socket.setblocking(False)
+        if sock.family == socket.AF_UNIX:
+            client_addr = f"{self.unix}:{client_socket.fileno()}"
+        else:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = Client(client_socket, client_addr)
+        self.clients[client_socket] = client
+        self.broadcast.add(client)
+        self.routes.clear()
+        self.sel.register(client_socket, selectors.EVENT_READ, client)
         logger.info(f"New client: {client_addr}")
-        while True:
-            try:
-                data = client_socket.recv(128)
-                if not data:
-                    break
-                logger.info(f"[{client_addr} -> srv]: {data}")
 
-                # Broadcast
-                for c in clients:
-                    if c != client_socket:
-                        logger.info(f"[srv -> {c.getpeername()}]: {data}")
-                        c.sendall(data)
+    def disconnect(self, client):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        self.unsubscribe(client)
+        self.broadcast.discard(client)
+        self.pending.discard(client)
+        self.routes.clear()
+        self.resume_producers(client)
+        for c in client.paused_by:
+            c.blocking.discard(client)
+        if client.events:
+            self.sel.unregister(client.sock)
+        client.sock.close()
+        for ring in (client.ring, client.ring_pending):
+            if ring is not None:
+                ring.close()
+        if client.dropped or client.coalesced:
+            logger.warning(f"{client.addr}: {client.dropped} lines dropped, {client.coalesced} coalesced")
+        logger.info(f"{client.addr} closed")
+
+    def handle_read(self, client):
+        try:
+            data = client.sock.recv(Server.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.error(e)
+            data = b""
+        if not data:
+            self.disconnect(client)
+            return
+        client.bytes_in += len(data)
+        if self.tracer is not None:
+            self.tracer("[%s -> srv]: %s", client.addr, data)
+
+        # Only forward complete lines, keep the tail for the next read
+        eol = data.rfind(b"\n")
+        lines = None
+        if eol >= 0:
+            if client.rbuf:
+                client.rbuf += memoryview(data)[:eol+1]
+                lines = bytes(client.rbuf)
+                client.rbuf.clear()
+            else:
+                lines = data if eol+1 == len(data) else data[:eol+1]
+        client.rbuf += memoryview(data)[eol+1:]
+        if lines is not None:
+            self.route(client, lines)
+        if len(client.rbuf) > Server.MAX_LINE:
+            logger.error(f"{client.addr}: line exceeds {Server.MAX_LINE} bytes")
+            self.disconnect(client)
 
-            except Exception as e:
-                logger.error(e)
-                break
+    def route(self, client, data):
+        """ Forward complete lines to the subscribers of their prefix. Runs of
+            lines with a common prefix are forwarded as a single slice. """
+        prefix = client.last_prefix
+        # Fast path: all lines share the prefix of the sender's last line
+        if prefix and data.startswith(prefix) and \
+           (data.count(b"\n" + prefix) == data.count(b"\n") - 1) and \
+           (prefix != CTRL_PREFIX):
+            self.forward(client, prefix, data)
+            return
 
-        clients.remove(client_socket)
-        client_socket.close()
-        logger.info(f"{client_addr} closed")
+        pos = 0
+        run_start = 0
+        run_prefix = None
+        while pos < len(data):
+            eol = data.index(b"\n", pos)
+            if not run_prefix or not data.startswith(run_prefix, pos):
+                prefix = get_prefix(data, pos)
+                if prefix != run_prefix:
+                    if pos > run_start:
+                        self.forward(client, run_prefix, data[run_start:pos])
+                    run_start = pos
+                    run_prefix = prefix
+            if run_prefix == CTRL_PREFIX:
+                self.handle_srv_cmd(client, data[pos+len(CTRL_PREFIX):eol])
+                run_start = eol+1
+            pos = eol+1
+        if pos > run_start:
+            self.forward(client, run_prefix, data[run_start:pos])
+        client.last_prefix = run_prefix
 
+    def forward(self, client, prefix, data):
+        if self.trace is not None:
+            self.trace.write(prefix, data)
+        lines = data.count(b"\n")
+        client.lines_in += lines
+        stats = self.prefix_stats.get(prefix)
+        if stats is None:
+            stats = self.prefix_stats[prefix] = [0, 0]
+        stats[0] += lines
+        stats[1] += len(data)
+        if prefix in self.snapshot:
+            cache = client.state.get(prefix)
+            if cache is None:
+                cache = client.state[prefix] = StateCache(prefix)
+            cache.update(data)
+        targets = self.routes.get(prefix)
+        if targets is None:
+            targets = tuple(self.index.get(prefix, ())) + tuple(self.broadcast)
+            self.routes[prefix] = targets
+        stamp = None
+        for c in targets:
+            if c is not client:
+                if not c.wq:
+                    c.wq_since = time.monotonic()
+                    self.pending.add(c)
+                if c.stamps:
+                    if stamp is None:
+                        stamp = CTRL_PREFIX + b'{"rx": %d}\n' % time.time_ns()
+                    c.wq.append(stamp)
+                    c.wq_bytes += len(stamp)
+                c.wq.append(data)
+                c.wq_bytes += len(data)
+                c.lines_out += lines
+                if c.wq_bytes > self.queue_size:
+                    self.handle_full(client, c)
 
-def main(addr, port, nmax):
-    s = Server(addr, port, nmax)
+    def handle_full(self, producer, client):
+        if self.policy == POLICY_BLOCK:
+            # Stop reading from the producer until the queue drained
+            if not producer.paused_by:
+                producer.paused_since = time.monotonic()
+            client.blocking.add(producer)
+            producer.paused_by.add(client)
+            self.update_events(producer)
+            return
+        if not client.dropped and not client.coalesced:
+            logger.warning(f"{client.addr} cannot keep up, applying policy '{self.policy}'")
+        self.compact(client)
+
+    def compact(self, client):
+        """ Reduce the queue to half of its size. Replaced state messages are
+            counted as coalesced, removed stream messages as dropped. """
+        wq = client.wq
+        # A partially written frame must be completed
+        head = wq.popleft() if isinstance(wq[0], memoryview) else None
+        lines = [l + b"\n" for l in b"".join(wq).split(b"\n")[:-1]]
+        wq.clear()
+
+        keys = [None] * len(lines)
+        if self.policy == POLICY_COALESCE:
+            latest = {}
+            for i, line in enumerate(lines):
+                keys[i] = get_state_key(line)
+                if keys[i] is not None:
+                    latest[keys[i]] = i
+            lines_coalesced = len(lines)
+            lines = [l for i, (l, k) in enumerate(zip(lines, keys)) if (k is None) or (latest[k] == i)]
+            keys = [k for i, k in enumerate(keys) if (k is None) or (latest[k] == i)]
+            client.coalesced += lines_coalesced - len(lines)
+
+        # Drop oldest stream messages, latest state is kept
+        size = sum(len(l) for l in lines) + (len(head) if head else 0)
+        keep = []
+        for line, key in zip(lines, keys):
+            if (size > self.queue_size // 2) and (key is None):
+                size -= len(line)
+                client.dropped += 1
+            else:
+                keep.append(line)
+
+        if head:
+            wq.append(head)
+        if keep:
+            wq.append(b"".join(keep))
+        client.wq_bytes = size
+
+    def handle_srv_cmd(self, client, data):
+        try:
+            cmd = json.loads(data)
+        except ValueError:
+            cmd = None
+        # a malformed command must not stop the server for all clients
+        if not isinstance(cmd, dict) or \
+           (("subscribe" in cmd) and not (isinstance(cmd["subscribe"], list) and
+                                          all(isinstance(p, str) for p in cmd["subscribe"]))):
+            logger.warning(f"Invalid server command from {client.addr}: {data}")
+            return
+        if "shm" in cmd:
+            self.attach_ring(client, cmd["shm"])
+        if "subscribe" in cmd:
+            self.subscribe(client, [p.encode() for p in cmd["subscribe"]])
+        if "stamps" in cmd:
+            client.stamps = bool(cmd["stamps"])
+        if cmd.get("drained") and client.wq:
+            self.flush(client)
+        if cmd.get("stats"):
+            self.reply(client, {"stats": self.get_stats()})
+
+    def reply(self, client, msg):
+        """ Queue a control message to a single client. """
+        self.queue(client, CTRL_PREFIX + json.dumps(msg).encode() + b"\n")
+
+    def queue(self, client, data):
+        """ Queue data to a single client, flushed with the routed data. """
+        if not client.wq:
+            client.wq_since = time.monotonic()
+            self.pending.add(client)
+        client.wq.append(data)
+        client.wq_bytes += len(data)
+
+    def get_stats(self):
+        now = time.monotonic()
+        return {
+            "uptime_s": now - self.started,
+            "clients": [c.get_stats(now) for c in self.clients.values()],
+            "prefixes": {p.decode(errors="replace"): {"lines": n, "bytes": b} for p, (n, b) in self.prefix_stats.items()},
+        }
+
+    def attach_ring(self, client, name):
+        if not isinstance(name, str):
+            logger.error(f"{client.addr}: invalid shared memory name {name!r}")
+            return
+        if (client.ring is not None) or (client.ring_pending is not None):
+            logger.error(f"{client.addr}: shared memory already attached")
+            return
+        try:
+            ring = ShmRing.attach(name)
+        except (OSError, ValueError) as e:
+            logger.error(f"{client.addr}: cannot attach shared memory {name}: {e}")
+            return
+        # The client drains the socket up to the marker before it reads the
+        # ring. Queued frames were not sent yet and go to the ring, except
+        # for the rest of a frame begun on the socket.
+        wq = client.wq
+        head = wq.popleft() if wq and isinstance(wq[0], memoryview) else b""
+        client.wq_bytes -= len(head)
+        client.handshake = bytes(head) + SHM_ATTACHED
+        client.ring_pending = ring
+        if not wq:
+            client.wq_since = time.monotonic()
+        self.pending.add(client)
+        logger.info(f"{client.addr} receives via shared memory {name} ({ring.capacity} bytes)")
+
+    def subscribe(self, client, prefixes):
+        added = set(prefixes) - (client.subscriptions or set())
+        self.unsubscribe(client)
+        self.broadcast.discard(client)
+        client.subscriptions = set(prefixes)
+        for p in client.subscriptions:
+            self.index.setdefault(p, set()).add(client)
+        self.routes.clear()
+        logger.info(f"{client.addr} subscribed to {sorted(client.subscriptions)}")
+        self.send_snapshot(client, added & self.snapshot)
+
+    def send_snapshot(self, client, prefixes):
+        """ Queue the latest state of `prefixes` sent by the other clients,
+            ahead of any live data. """
+        for c in self.clients.values():
+            if c is client:
+                continue
+            for p in prefixes:
+                cache = c.state.get(p)
+                data = cache.snapshot() if cache is not None else b""
+                if data:
+                    self.queue(client, data)
+                    logger.info(f"{client.addr}: sent {len(data)} bytes of {p.decode()} state from {c.addr}")
+
+    def unsubscribe(self, client):
+        for p in client.subscriptions or ():
+            self.index[p].discard(client)
+            if not self.index[p]:
+                del self.index[p]
+        client.subscriptions = None
+
+    def get_timeout(self):
+        """ Time until the next held back flush is due, None to wait for I/O. """
+        if not self.pending or not self.flush_interval:
+            return None
+        # clients waiting for their peer are flushed on its I/O, not by time
+        since = [c.wq_since for c in self.pending if not (c.want_write or c.ring_full)]
+        if not since:
+            return None
+        return max(0.0, min(since) + self.flush_interval - time.monotonic())
+
+    def flush_pending(self):
+        now = time.monotonic()
+        for c in list(self.pending):
+            if c.want_write or c.ring_full:
+                continue
+            if (c.wq_bytes >= self.flush_size) or (now - c.wq_since >= self.flush_interval):
+                self.flush(c)
+
+    def flush(self, client):
+        """ Write queued frames with as few sendmsg() calls as possible. """
+        wq = client.wq
+        # once per batch, partial writes are continued without a new stamp
+        if client.stamps and wq and not client.fwd_stamped:
+            client.fwd_stamped = True
+            stamp = CTRL_PREFIX + b'{"fwd": %d}\n' % time.time_ns()
+            # a partially written frame must be completed first
+            wq.insert(1 if isinstance(wq[0], memoryview) else 0, stamp)
+            client.wq_bytes += len(stamp)
+        try:
+            if client.handshake:
+                self.send_handshake(client)
+            while wq and not client.handshake:
+                bufs = list(wq) if len(wq) <= IOV_MAX else [wq[i] for i in range(IOV_MAX)]
+                if client.ring is not None:
+                    n = self.write_ring(client, bufs)
+                    if not n:
+                        break
+                else:
+                    n = client.sock.sendmsg(bufs)
+                client.wq_bytes -= n
+                client.bytes_out += n
+                while n:
+                    head = wq[0]
+                    if n >= len(head):
+                        n -= len(head)
+                        wq.popleft()
+                    else:
+                        wq[0] = memoryview(head)[n:]
+                        n = 0
+        except (BlockingIOError, InterruptedError):
+            pass
+        except (OSError, ValueError) as e:
+            # ValueError: the client corrupted its ring, only drop this client
+            logger.error(f"{client.addr}: {e}")
+            self.disconnect(client)
+            return
+        if not wq and not client.handshake:
+            self.pending.discard(client)
+            client.fwd_stamped = False
+            if client.stalled_since is not None:
+                client.stalled_s += time.monotonic() - client.stalled_since
+                client.stalled_since = None
+        elif client.stalled_since is None:
+            client.stalled_since = time.monotonic()
+        if client.blocking and (client.wq_bytes <= self.queue_size // 2):
+            self.resume_producers(client)
+        client.want_write = bool(client.handshake) or (bool(wq) and (client.ring is None))
+        client.ring_full = bool(wq) and (client.ring is not None)
+        self.update_events(client)
+
+    def send_handshake(self, client):
+        """ Write the handshake to the socket and switch to the ring once it
+            is complete. """
+        n = client.sock.send(client.handshake)
+        client.bytes_out += n
+        client.handshake = client.handshake[n:]
+        if not client.handshake:
+            client.ring, client.ring_pending = client.ring_pending, None
+
+    def write_ring(self, client, bufs):
+        """ Copy frames into the client's ring and ring the doorbell if the
+            client waits for data. When the ring is full, the client sends a
+            drained command once it consumed data. """
+        ring = client.ring
+        n = ring.write(bufs)
+        if not n:
+            ring.set(OFS_FULL, 1)
+            # the client may have drained before the flag was set
+            n = ring.write(bufs)
+        if n and ring.take_flag(OFS_WAITING):
+            try:
+                client.sock.send(DOORBELL)
+            except (BlockingIOError, InterruptedError):
+                # unread doorbells are pending anyway
+                pass
+        return n
+
+    def resume_producers(self, client):
+        for p in client.blocking:
+            p.paused_by.discard(client)
+            if not p.paused_by:
+                p.paused_s += time.monotonic() - p.paused_since
+                p.paused_since = None
+            self.update_events(p)
+        client.blocking.clear()
+
+    def update_events(self, client):
+        """ Register the I/O a client currently waits for with the selector. """
+        events = (0 if client.paused_by else selectors.EVENT_READ) | \
+                 (selectors.EVENT_WRITE if client.want_write else 0)
+        if events == client.events:
+            return
+        if not events:
+            self.sel.unregister(client.sock)
+        elif not client.events:
+            self.sel.register(client.sock, events, client)
+        else:
+            self.sel.modify(client.sock, events, client)
+        client.events = events
+
+
+def main(addr, port, nmax, flush_size, flush_interval, queue_size, policy, record, unix, snapshot):
+    s = Server(addr, port, nmax, flush_size=flush_size, flush_interval=flush_interval,
+               queue_size=queue_size, policy=policy, record=record, unix=unix, snapshot=snapshot)
     s.run()
 
 def get_args():
@@ -68,21 +752,24 @@ def get_args():
     parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
     parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
     parser.add_argument("-n", "--nmax", action="store", type=int, default=5, help="Maximum number of connections")
+    parser.add_argument("--flush-size", action="store", type=int, default=0, help="Hold back data until this many bytes are pending for a client, at most --flush-interval (required)")
+    parser.add_argument("--flush-interval", action="store", type=float, default=0.0, help="Maximum time in ms data is held back, see --flush-size")
+    parser.add_argument("-q", "--queue-size", action="store", type=int, default=16*1024, help="Maximum pending KiB per client before --policy is applied")
+    parser.add_argument("--policy", action="store", choices=POLICIES, default=POLICY_BLOCK,
+                        help="block: pause the producer; drop-oldest: drop the oldest messages; coalesce: keep the latest state per key, drop oldest others")
+    parser.add_argument("-u", "--unix", action="store", type=str, default=None, help="Additionally listen on a Unix domain socket at this path")
+    parser.add_argument("-r", "--record", action="store", type=str, default=None, help="Record all routed messages to this trace file, see replay.py")
+    parser.add_argument("--snapshot", action="store", type=str, nargs="*", default=list(SNAPSHOT_PREFIXES), metavar="PREFIX",
+                        help="New subscribers of these prefixes first receive the latest state, e.g., LEDs or the SSD1306 GRAM; none to disable")
+    log.add_log_args(parser, level="WARNING")
     return parser.parse_args()
 
 
 if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.WARNING,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler("debug.log"),
-            logging.StreamHandler()
-        ]
-    )
-
     args = get_args()
-    main(addr=args.address, port=args.port, nmax=args.nmax)
-
-
+    log.setup_logging(args)
 
+    main(addr=args.address, port=args.port, nmax=args.nmax,
+         flush_size=args.flush_size, flush_interval=args.flush_interval/1000,
+         queue_size=args.queue_size*1024, policy=args.policy, record=args.record,
+         unix=args.unix, snapshot=args.snapshot)
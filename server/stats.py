@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     stats.py
+# Usage:    Periodically query and print the server's per-client and
+#           per-prefix statistics, e.g., to find the bottleneck under load.
+#
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from simio import transport
+from simio import log
+from simio.framing import LineFramer
+
+logger = logging.getLogger(__name__)
+
+
+def query(conn, framer):
+    """ Request the statistics and wait for the reply. """
+    conn.sendall(transport.STATS_CMD)
+    while True:
+        data = conn.recv(64*1024)
+        if not data:
+            raise ConnectionError("Server closed the connection")
+        for line in framer.feed(data):
+            if line.startswith(transport.CTRL_PREFIX):
+                return json.loads(line[len(transport.CTRL_PREFIX):])["stats"]
+
+
+def rate(cur, prev, key, dt, age):
+    """ Rate of counter `key` since the previous sample, or since the client
+        connected for the first sample. """
+    if prev is None:
+        return cur[key] / age if age > 0 else 0.0
+    return (cur[key] - prev[key]) / dt if dt > 0 else 0.0
+
+def print_stats(stats, prev, dt):
+    prev_clients = {c["addr"]: c for c in prev["clients"]} if prev else {}
+    print(f"uptime {stats['uptime_s']:.1f} s")
+    print(f"{'client':<28} {'in/s':>9} {'in MB/s':>8} {'out/s':>9} {'out MB/s':>8} {'queue KiB':>9} "
+          f"{'dropped':>8} {'coalesced':>9} {'paused':>7} {'stalled':>7}  subscriptions")
+    for c in stats["clients"]:
+        p = prev_clients.get(c["addr"])
+        age = c["connected_s"]
+        paused = rate(c, p, "paused_s", dt, age)
+        stalled = rate(c, p, "stalled_s", dt, age)
+        subs = "all" if c["subscriptions"] is None else ",".join(c["subscriptions"])
+        if c["shm"]:
+            subs += " (shm)"
+        print(f"{c['addr']:<28} {rate(c, p, 'lines_in', dt, age):>9.0f} {rate(c, p, 'bytes_in', dt, age)/1e6:>8.2f} "
+              f"{rate(c, p, 'lines_out', dt, age):>9.0f} {rate(c, p, 'bytes_out', dt, age)/1e6:>8.2f} "
+              f"{c['queue_bytes']/1024:>9.1f} {c['dropped']:>8} {c['coalesced']:>9} "
+              f"{paused:>7.1%} {stalled:>7.1%}  {subs}")
+    print(f"{'prefix':<28} {'lines/s':>9} {'MB/s':>8}")
+    age = stats["uptime_s"]
+    for prefix, s in sorted(stats["prefixes"].items()):
+        p = prev["prefixes"].get(prefix) if prev else None
+        print(f"{prefix:<28} {rate(s, p, 'lines', dt, age):>9.0f} {rate(s, p, 'bytes', dt, age)/1e6:>8.2f}")
+    print()
+
+
+def main(args):
+    conn = transport.connect(args.address, args.port, unix=args.unix)
+    # only receive the replies
+    conn.subscribe([])
+    framer = LineFramer()
+    prev = None
+    try:
+        n = 0
+        while True:
+            stats = query(conn, framer)
+            if args.json:
+                print(json.dumps(stats), flush=True)
+            else:
+                print_stats(stats, prev, stats["uptime_s"] - prev["uptime_s"] if prev else 0.0)
+            prev = stats
+            n += 1
+            if args.count and (n >= args.count):
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Show the statistics of a running SimIO server")
+    parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
+    parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
+    parser.add_argument("-u", "--unix", action="store", type=str, default=None, help="Connect to the server's Unix domain socket at this path instead of TCP")
+    parser.add_argument("-i", "--interval", action="store", type=float, default=1.0, help="Time between two samples [s]")
+    parser.add_argument("-n", "--count", action="store", type=int, default=0, help="Stop after n samples, 0 to run until interrupted")
+    parser.add_argument("-j", "--json", action="store_true", help="Print the raw statistics, one JSON object per line")
+    log.add_log_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    log.setup_logging(args)
+
+    main(args)
@@ -0,0 +1,156 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     tracefile.py
+# Usage:    Append-only trace files of the server's routed traffic.
+#
+# Layout:
+#   <trace>       Header, then records of (t_ns:u64, len:u32, lines), where
+#                 t_ns is the receive time relative to the start of the
+#                 recording and lines is a run of complete lines.
+#   <trace>.idx   Fixed-size index entries (kind:u8, value:u8, line:u32,
+#                 t_ns:u64, offset:u64) pointing to the record at `offset`
+#                 and the line `line` bytes into it. Entries of kind
+#                 INDEX_TIME are written periodically, INDEX_VSYNC for every
+#                 VSync edge of the VGA display (`value` is the new level).
+#
+
+import os
+import re
+import mmap
+import time
+import struct
+
+MAGIC = b"SIMIOTRC"
+VERSION = 1
+HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<QI")
+INDEX = struct.Struct("<BBxxIQQ")
+
+INDEX_TIME  = 0
+INDEX_VSYNC = 1
+
+# Time between two INDEX_TIME entries
+TIME_INDEX_INTERVAL_NS = 10_000_000
+
+VGA_PREFIX = b"[displayvga]-"
+VSYNC_RE = re.compile(rb'^\[displayvga\]-(?:#02[0-9a-fA-F]{8}([0-9a-fA-F]{2})|\{[^\n]*"type"\s*:\s*"vs")', re.M)
+VALUE_RE = re.compile(rb'"value"\s*:\s*(\d+)')
+
+def find_vsync(data):
+    """ Yield (offset, value) of the VSync events in a run of VGA lines. """
+    for m in VSYNC_RE.finditer(data):
+        if m.group(1) is not None:
+            yield m.start(), int(m.group(1), 16)
+        else:
+            value = VALUE_RE.search(data, m.start(), data.index(b"\n", m.start()))
+            yield m.start(), int(value.group(1)) if value else 0
+
+
+class TraceWriter:
+    def __init__(self, path) -> None:
+        self.path = path
+        self.f = open(path, "wb")
+        self.idx = open(path + ".idx", "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION))
+        self.offset = HEADER.size
+        self.t0 = time.monotonic_ns()
+        self.next_time_index = 0
+
+    def write(self, prefix, data):
+        t = time.monotonic_ns() - self.t0
+        if t >= self.next_time_index:
+            self.idx.write(INDEX.pack(INDEX_TIME, 0, 0, t, self.offset))
+            self.next_time_index = t + TIME_INDEX_INTERVAL_NS
+        if prefix == VGA_PREFIX:
+            for line, value in find_vsync(data):
+                self.idx.write(INDEX.pack(INDEX_VSYNC, value, line, t, self.offset))
+        self.f.write(RECORD.pack(t, len(data)))
+        self.f.write(data)
+        self.offset += RECORD.size + len(data)
+
+    def close(self):
+        self.f.close()
+        self.idx.close()
+
+
+class TraceReader:
+    """ Memory-mapped trace, records are returned as views into the file. """
+    def __init__(self, path) -> None:
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self.mm, 0)
+        if (magic != MAGIC) or (version != VERSION):
+            raise ValueError(f"{path} is not a SimIO trace (version {VERSION})")
+        self.index = self.read_index(path + ".idx")
+
+    def read_index(self, path):
+        """ Read the index, rebuild it if it is missing or incomplete, e.g.,
+            after the server was killed. """
+        index = []
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            index = list(INDEX.iter_unpack(data[:len(data) - len(data) % INDEX.size]))
+        start = index[-1][4] if index else HEADER.size
+        for t, offset, data in self.records(start):
+            if index and (offset == index[-1][4]):
+                continue
+            if (not index) or (t >= index[-1][3] + TIME_INDEX_INTERVAL_NS):
+                index.append((INDEX_TIME, 0, 0, t, offset))
+            if data[:len(VGA_PREFIX)] == VGA_PREFIX:
+                index += [(INDEX_VSYNC, value, line, t, offset) for line, value in find_vsync(bytes(data))]
+        return index
+
+    def records(self, offset=HEADER.size, line=0):
+        """ Yield (t_ns, offset, data) of all records starting at `offset`,
+            the first one starting `line` bytes into the record. """
+        mm = memoryview(self.mm)
+        while offset + RECORD.size <= len(mm):
+            t, n = RECORD.unpack_from(mm, offset)
+            start = offset + RECORD.size
+            if start + n > len(mm):
+                # incomplete last record
+                break
+            yield t, offset, mm[start+line:start+n]
+            offset = start + n
+            line = 0
+
+    def seek_frame(self, n, value=0):
+        """ Position (offset, line) of the n-th VSync edge to `value`. """
+        frames = [(e[4], e[2]) for e in self.index if e[0] == INDEX_VSYNC and e[1] == value]
+        if n >= len(frames):
+            raise IndexError(f"Trace has only {len(frames)} frames")
+        return frames[n]
+
+    def seek_time(self, t_ns):
+        """ Offset of the first record received at or after `t_ns`. """
+        offset = HEADER.size
+        for e in self.index:
+            if e[0] != INDEX_TIME:
+                continue
+            if e[3] > t_ns:
+                break
+            offset = e[4]
+        for t, offset, _ in self.records(offset):
+            if t >= t_ns:
+                return offset
+        return len(self.mm)
+
+    def get_frame_cnt(self, value=0):
+        return sum(1 for e in self.index if e[0] == INDEX_VSYNC and e[1] == value)
+
+    def get_duration(self):
+        t = 0
+        for t, _, _ in self.records(self.index[-1][4] if self.index else HEADER.size):
+            pass
+        return t
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            # records are still referenced, closed when collected
+            pass
+        self.f.close()
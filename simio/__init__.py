@@ -0,0 +1,7 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     __init__.py
+# Usage:    Python helpers shared by the SimIO server and components.
+#
@@ -0,0 +1,147 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     client.py
+# Usage:    Connection of one component to the SimIO server: subscription,
+#           line framing, batched sending and reconnect.
+#
+
+import json
+import time
+import socket
+import threading
+import logging
+from simio import transport
+from simio.framing import LineFramer
+from simio import latency
+
+logger = logging.getLogger(__name__)
+
+
+class Client:
+    """ Receives the lines starting with `prefix` and passes them (decoded,
+        without prefix) in batches, one per received chunk, to `on_lines`.
+        If the connection is lost, it is re-established every
+        RECONNECT_INTERVAL seconds until the client is stopped. With
+        `stamps`, the time stamps of the batch passed last are in
+        `self.stamps`, see simio/latency.py. """
+    RECONNECT_INTERVAL = 1.0
+
+    def __init__(self, prefix, addr="localhost", port=1080, unix=None, shm=0,
+                 recv_size=256*1024, reconnect=True, stamps=False) -> None:
+        self.prefix = prefix
+        self.addr = addr
+        self.port = port
+        self.unix = unix
+        self.shm = shm
+        self.recv_size = recv_size
+        self.reconnect = reconnect
+        self.stamps = {} if stamps else None
+        self.conn = None
+        # warn once per outage, not on every reconnect attempt
+        self.warned = False
+        self.framer = LineFramer()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get_name(self):
+        return self.unix or f"{self.addr}:{self.port}"
+
+    def connect(self):
+        """ Connect and subscribe, raises OSError if the server is not
+            reachable. """
+        conn = transport.connect(self.addr, self.port, unix=self.unix, shm=self.shm)
+        conn.subscribe([self.prefix] if self.prefix else [], stamps=self.stamps is not None)
+        self.framer.reset()
+        with self.lock:
+            self.conn = conn
+        logger.info(f"Connected to server: {self.get_name()}")
+
+    def try_connect(self):
+        try:
+            self.connect()
+        except OSError as e:
+            if not self.reconnect:
+                raise
+            if not self.warned:
+                logger.warning(f"Cannot connect to server {self.get_name()}: {e}, retrying")
+                self.warned = True
+            return False
+        self.warned = False
+        return True
+
+    def start(self, on_lines):
+        """ Receive in a background thread. """
+        self.thread = threading.Thread(target=self.run, args=(on_lines,), daemon=True)
+        self.thread.start()
+
+    def run(self, on_lines):
+        """ Receive until stop() is called or, without reconnect, the server
+            closes the connection. """
+        prefix = self.prefix.encode()
+        n = len(prefix)
+        while not self.stop_event.is_set():
+            if (self.conn is None) and not self.try_connect():
+                self.stop_event.wait(Client.RECONNECT_INTERVAL)
+                continue
+            try:
+                data = self.conn.recv(self.recv_size)
+            except OSError:
+                data = b""
+            t_recv = time.time_ns()
+            if not data:
+                self.disconnect()
+                if not self.reconnect:
+                    break
+                continue
+            lines = self.framer.feed(data)
+            if self.stamps is not None:
+                self.stamps = latency.get_stamps(lines, transport.CTRL_PREFIX)
+                self.stamps["recv"] = t_recv
+                # an empty prefix would pass the stamp lines on
+                lines = [l for l in lines if not l.startswith(transport.CTRL_PREFIX)]
+            try:
+                # lines are complete, decoding cannot split characters
+                lines = [l[n:].decode() for l in lines if l.startswith(prefix)]
+                if lines:
+                    on_lines(lines)
+            except Exception:
+                # a malformed line must not stop receiving
+                logger.exception("Cannot handle received data")
+
+    def send(self, *msgs, prefix=None):
+        """ Send messages (dict or str) with the client's prefix, or
+            `prefix`, in a single write. Messages are dropped while
+            disconnected. """
+        prefix = self.prefix if prefix is None else prefix
+        data = "".join(f"{prefix}{m if isinstance(m, str) else json.dumps(m)}\n" for m in msgs).encode()
+        with self.lock:
+            if self.conn is None:
+                logger.debug("Not connected, dropped %s", data)
+                return
+            try:
+                self.conn.sendall(data)
+            except OSError as e:
+                logger.warning(f"Send failed: {e}")
+
+    def disconnect(self):
+        with self.lock:
+            conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.close()
+            if not self.stop_event.is_set():
+                logger.warning(f"Disconnected from server: {self.get_name()}")
+
+    def stop(self):
+        self.stop_event.set()
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if (self.thread is not None) and (self.thread is not threading.current_thread()):
+            self.thread.join()
+        self.disconnect()
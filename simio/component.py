@@ -0,0 +1,158 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     component.py
+# Usage:    Base class of the tkinter GUI components.
+#
+
+import os
+import abc
+import time
+import threading
+import logging
+import tkinter as tk
+from simio import transport
+from simio.client import Client
+from simio.latency import LatencyLog
+
+logger = logging.getLogger(__name__)
+
+
+def add_client_args(parser):
+    parser.add_argument("-s", "--server", action="store_true", help="Connect to sockets server")
+    parser.add_argument("-a", "--address", action="store", type=str, default="localhost", help="Sockets server address")
+    parser.add_argument("-p", "--port", action="store", type=int, default=1080, help="Sockets server port")
+    transport.add_transport_args(parser)
+    parser.add_argument("--latency", action="store", type=str, default=None,
+                        help="Append time stamps of every received batch to this file, see server/latency.py")
+
+def get_client_kwargs(args):
+    return dict(socks_connect=args.server, addr=args.address, port=args.port, unix=args.unix, shm=args.shm*1024,
+                latency=args.latency)
+
+
+class Component(tk.Frame, metaclass=abc.ABCMeta):
+    """ A GUI component receiving the lines of SRV_PREFIX. Lines are parsed
+        by parse() in the receive thread; the parsed items are collected
+        and handed to handle_batch() in the Tk thread. Tk is woken via a
+        pipe registered with createfilehandler(); where that is unavailable,
+        e.g., on Windows, the batch is polled every POLL_MS.
+        With `latency`, the time stamps of each batch are logged once it is
+        rendered, i.e., after handle_batch() or, with DEFERRED_RENDER, when
+        the component calls rendered(). """
+    SRV_PREFIX  = None
+    RECV_SIZE   = 256*1024
+    POLL_MS     = 10
+    DEFERRED_RENDER = False
+
+    def __init__(self, parent, socks_connect=False, addr="localhost", port=1080, unix=None, shm=0, latency=None, *args, **kwargs):
+        tk.Frame.__init__(self, parent, *args, **kwargs)
+        self.parent = parent
+        self.parent.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.client = None
+        self.latency = None
+        if socks_connect:
+            self.client = Client(self.SRV_PREFIX, addr=addr, port=port, unix=unix, shm=shm, recv_size=self.RECV_SIZE,
+                                 stamps=latency is not None)
+            if latency is not None:
+                self.latency = LatencyLog(latency)
+        # stamps of the batch not taken yet and of the taken, not rendered ones
+        self.batch_stamps = []
+        self.unrendered = []
+        self.batch = []
+        self.lock = threading.Lock()
+        self.polling = False
+        self.wake_r = None
+
+    def connect(self):
+        """ Start receiving, call after the widgets used by handle_batch()
+            were created. """
+        if self.client is None:
+            return
+        self.wake_r, self.wake_w = os.pipe()
+        try:
+            self.tk.createfilehandler(self.wake_r, tk.READABLE, self.on_wake)
+        except (AttributeError, tk.TclError):
+            self.polling = True
+            self.poll()
+        self.client.try_connect()
+        self.client.start(self.receive)
+
+    def receive(self, lines):
+        items = self.parse(lines)
+        stamps = None
+        if self.latency is not None:
+            stamps = dict(self.client.stamps, parsed=time.time_ns())
+        self.push(items, stamps)
+
+    def parse(self, lines):
+        """ Runs in the receive thread, returns a list of items. """
+        return lines
+
+    @abc.abstractmethod
+    def handle_batch(self, batch):
+        """ Runs in the Tk thread with all items parsed since the last call. """
+
+    def send(self, *msgs, prefix=None):
+        if self.client is not None:
+            self.client.send(*msgs, prefix=prefix)
+
+    def push(self, items, stamps=None):
+        if not items:
+            return
+        with self.lock:
+            wake = not self.batch
+            self.batch.extend(items)
+            if stamps is not None:
+                self.batch_stamps.append(stamps)
+        if wake and not self.polling:
+            os.write(self.wake_w, b"\0")
+
+    def take(self):
+        with self.lock:
+            batch, self.batch = self.batch, []
+            stamps, self.batch_stamps = self.batch_stamps, []
+        if stamps:
+            now = time.time_ns()
+            for s in stamps:
+                s["handled"] = now
+            self.unrendered += stamps
+        return batch
+
+    def rendered(self):
+        """ Log the stamps of all batches taken so far as rendered. """
+        if not self.unrendered:
+            return
+        now = time.time_ns()
+        for s in self.unrendered:
+            s["rendered"] = now
+            self.latency.write(s)
+        self.unrendered = []
+
+    def on_wake(self, fd, mask):
+        os.read(fd, 4096)
+        self.poll_batch()
+
+    def poll(self):
+        self.poll_batch()
+        self.after(self.POLL_MS, self.poll)
+
+    def poll_batch(self):
+        batch = self.take()
+        if batch:
+            self.handle_batch(batch)
+            if not self.DEFERRED_RENDER:
+                self.rendered()
+
+    def on_closing(self):
+        if self.client is not None:
+            self.client.stop()
+        if self.wake_r is not None:
+            if not self.polling:
+                self.tk.deletefilehandler(self.wake_r)
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+        if self.latency is not None:
+            self.latency.close()
+        self.parent.destroy()
@@ -0,0 +1,34 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     framing.py
+# Usage:    Splits the received byte stream into lines.
+#
+
+class LineFramer:
+    """ Accepts bytes, bytearray or memoryview chunks and returns the
+        complete lines (bytes, without delimiter). Framing is done on the raw
+        bytes, so multi-byte characters split across chunks stay intact.
+        Every byte is scanned once; only the incomplete tail is kept. """
+    def __init__(self, delimiter=b"\n") -> None:
+        self.delimiter = delimiter
+        self.tail = bytearray()
+
+    def feed(self, data):
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        lines = data.split(self.delimiter)
+        if len(lines) == 1:
+            self.tail += data
+            return []
+        if self.tail:
+            # complete the pending line
+            self.tail += lines[0]
+            lines[0] = bytes(self.tail)
+        # last element is the incomplete line, b"" if data ends with delimiter
+        self.tail[:] = lines.pop()
+        return lines
+
+    def reset(self):
+        self.tail.clear()
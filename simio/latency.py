@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     latency.py
+# Usage:    Wall-clock stamps (time.time_ns()) along the path of received
+#           data, written by the GUIs with --latency and evaluated by
+#           server/latency.py. Each record is one JSON line with the stamps
+#           of one received batch:
+#
+#             rx        server received the (oldest) data of the batch
+#             fwd       server wrote the batch to the client
+#             recv      client received the batch
+#             parsed    client decoded the batch in the receive thread
+#             handled   Tk thread took the batch
+#             rendered  result is on screen
+#
+#           The gamepad additionally records key-to-LED round trips as
+#           {"key": ..., "led": ...}.
+#
+
+import json
+
+# Stage name -> (start stamp, end stamp)
+STAGES = {
+    "server":     ("rx", "fwd"),
+    "transport":  ("fwd", "recv"),
+    "decode":     ("recv", "parsed"),
+    "queue":      ("parsed", "handled"),
+    "render":     ("handled", "rendered"),
+    "total":      ("rx", "rendered"),
+    "key_to_led": ("key", "led"),
+}
+
+
+def get_stamps(lines, prefix):
+    """ Server stamps of the control lines ([simio]-{"rx": ...} or
+        {"fwd": ...}) among `lines`, the oldest rx and the latest fwd. """
+    rx = []
+    fwd = []
+    for line in lines:
+        if line.startswith(prefix):
+            try:
+                msg = json.loads(line[len(prefix):])
+            except ValueError:
+                continue
+            # other control lines, e.g., replies, are skipped
+            if not isinstance(msg, dict):
+                continue
+            if isinstance(msg.get("rx"), int):
+                rx.append(msg["rx"])
+            if isinstance(msg.get("fwd"), int):
+                fwd.append(msg["fwd"])
+    stamps = {}
+    if rx:
+        stamps["rx"] = min(rx)
+    if fwd:
+        stamps["fwd"] = max(fwd)
+    return stamps
+
+def get_stages(record):
+    """ Durations [s] of the stages covered by a record. """
+    return {name: (record[end] - record[start]) / 1e9 for name, (start, end) in STAGES.items()
+            if (start in record) and (end in record)}
+
+
+class LatencyLog:
+    """ Appends stamp records to a file, one JSON object per line. """
+    def __init__(self, path) -> None:
+        self.f = open(path, "a")
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.f.close()
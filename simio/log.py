@@ -0,0 +1,64 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     log.py
+# Usage:    Logging options shared by the server, the GUIs and the tools.
+#           Messages on hot paths, e.g., per received chunk or per line of
+#           pixels, are only logged in trace mode and sampled:
+#
+#             self.tracer = log.get_tracer(logger)
+#             ...
+#             if self.tracer is not None:
+#                 self.tracer("[%s -> srv]: %s", addr, data)
+#
+
+import logging
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Every n-th hot-path message is logged, 0 disables them
+trace_every = 0
+
+
+def add_log_args(parser, level="INFO"):
+    parser.add_argument("--log-level", action="store", choices=LEVELS, default=level, help="Minimum level of logged messages")
+    parser.add_argument("--log-file", action="store", type=str, default=None, help="Additionally write the log to this file")
+    parser.add_argument("--trace", action="store", type=int, default=0, metavar="N",
+                        help="Log every N-th hot-path message, e.g., received data, at DEBUG level; 0 disables tracing")
+
+def setup_logging(args):
+    """ Configure the root logger from the options of add_log_args(). """
+    global trace_every
+    trace_every = max(args.trace, 0)
+    handlers = [logging.StreamHandler()]
+    if args.log_file:
+        handlers.append(logging.FileHandler(args.log_file))
+    logging.basicConfig(
+        level=logging.DEBUG if trace_every else args.log_level,
+        format=FORMAT,
+        handlers=handlers
+    )
+
+
+class Tracer:
+    """ Logs every `every`-th call at DEBUG level. Arguments are only
+        formatted for the calls that are logged. """
+    def __init__(self, logger, every) -> None:
+        self.logger = logger
+        self.every = every
+        self.cnt = 0
+
+    def __call__(self, msg, *args):
+        self.cnt += 1
+        if self.cnt >= self.every:
+            self.cnt = 0
+            self.logger.debug(msg, *args)
+
+def get_tracer(logger):
+    """ Sampled logger for hot paths, None when tracing is disabled so
+        callers skip the call and building its arguments altogether. """
+    if not trace_every or not logger.isEnabledFor(logging.DEBUG):
+        return None
+    return Tracer(logger, trace_every)
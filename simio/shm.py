@@ -0,0 +1,117 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     shm.py
+# Usage:    Single-producer single-consumer byte ring in shared memory,
+#           used by the server to pass data to a local client without a
+#           socket write per message.
+#
+# Layout:
+#   0   head:u64      total bytes written by the producer
+#   8   tail:u64      total bytes consumed by the consumer
+#   16  waiting:u32   set by the consumer before it sleeps on the doorbell
+#   20  full:u32      set by the producer when data did not fit
+#   24  capacity:u64
+#   64  data
+#
+
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+HEADER_SIZE = 64
+POS = struct.Struct("<Q")
+FLAG = struct.Struct("<I")
+OFS_HEAD        = 0
+OFS_TAIL        = 8
+OFS_WAITING     = 16
+OFS_FULL        = 20
+OFS_CAPACITY    = 24
+
+
+class ShmRing:
+    def __init__(self, shm, owner=False) -> None:
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.capacity = POS.unpack_from(self.buf, OFS_CAPACITY)[0]
+
+    @classmethod
+    def create(cls, capacity):
+        """ Create a new ring, the creator unlinks it on close(). """
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE+capacity)
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        POS.pack_into(shm.buf, OFS_CAPACITY, capacity)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 tracks attached segments and would remove them
+            # when this process exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        # the header is written by the other process, check it fits the segment
+        capacity = POS.unpack_from(shm.buf, OFS_CAPACITY)[0] if shm.size >= HEADER_SIZE else 0
+        if not (0 < capacity <= shm.size - HEADER_SIZE):
+            shm.close()
+            raise ValueError(f"invalid ring: capacity {capacity} in a segment of {shm.size} bytes")
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def get(self, ofs, fmt=POS):
+        return fmt.unpack_from(self.buf, ofs)[0]
+
+    def set(self, ofs, value, fmt=POS):
+        fmt.pack_into(self.buf, ofs, value)
+
+    def write(self, bufs):
+        """ Copy as many bytes of `bufs` as fit, return the number written. """
+        head = self.get(OFS_HEAD)
+        free = self.capacity - (head - self.get(OFS_TAIL))
+        n = 0
+        for b in bufs:
+            k = min(len(b), free - n)
+            if k <= 0:
+                break
+            pos = (head + n) % self.capacity
+            first = min(k, self.capacity - pos)
+            self.buf[HEADER_SIZE+pos:HEADER_SIZE+pos+first] = b[:first]
+            if first < k:
+                self.buf[HEADER_SIZE:HEADER_SIZE+k-first] = b[first:k]
+            n += k
+        if n:
+            self.set(OFS_HEAD, head + n)
+        return n
+
+    def read(self, size):
+        """ Consume up to `size` bytes, b"" if the ring is empty. """
+        tail = self.get(OFS_TAIL)
+        k = min(self.get(OFS_HEAD) - tail, size)
+        if k <= 0:
+            return b""
+        pos = tail % self.capacity
+        first = min(k, self.capacity - pos)
+        data = bytes(self.buf[HEADER_SIZE+pos:HEADER_SIZE+pos+first])
+        if first < k:
+            data += bytes(self.buf[HEADER_SIZE:HEADER_SIZE+k-first])
+        self.set(OFS_TAIL, tail + k)
+        return data
+
+    def take_flag(self, ofs):
+        """ Clear a flag, return whether it was set. """
+        if not self.get(ofs, FLAG):
+            return False
+        self.set(ofs, 0, FLAG)
+        return True
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
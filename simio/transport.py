@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     transport.py
+# Usage:    Connection to the SimIO server via TCP or a Unix domain socket,
+#           optionally receiving through a shared-memory ring (shm.py).
+#
+
+import json
+import socket
+import threading
+from simio.shm import ShmRing, OFS_WAITING, OFS_FULL
+
+CTRL_PREFIX = b"[simio]-"
+# Sent by the server when data was written to the ring of a waiting client
+DOORBELL = b"\0"
+# Sent by the server over the socket once it writes to the ring instead
+SHM_ATTACHED = CTRL_PREFIX + json.dumps({"shm": "attached"}).encode() + b"\n"
+# Sent by the client when it consumed data from a ring the server found full
+DRAINED_CMD = CTRL_PREFIX + json.dumps({"drained": True}).encode() + b"\n"
+# Requests the server's statistics, answered with [simio]-{"stats": {...}}
+STATS_CMD = CTRL_PREFIX + json.dumps({"stats": True}).encode() + b"\n"
+
+
+def add_transport_args(parser):
+    parser.add_argument("-u", "--unix", action="store", type=str, default=None, help="Connect to the server's Unix domain socket at this path instead of TCP")
+    parser.add_argument("--shm", action="store", type=int, default=0, help="Receive through a shared-memory ring of this many KiB, 0 to disable")
+
+
+class Connection:
+    """ Socket-like connection, recv() drains the shared-memory ring if one
+        was negotiated and sleeps on the socket for the doorbell otherwise.
+        Until the server's attached marker arrived, data is received from
+        the socket only, so that it is passed on in order. Writes may come
+        from several threads and are serialized. """
+    def __init__(self, sock, ring=None) -> None:
+        self.sock = sock
+        self.ring = ring
+        self.attached = False
+        # Received tail that may be the beginning of the marker
+        self.rtail = b""
+        self.lock = threading.Lock()
+
+    def subscribe(self, prefixes, stamps=False):
+        """ Receive lines of `prefixes`, with the server's time stamps
+            interleaved if `stamps` is set, see simio/latency.py. """
+        cmd = {"subscribe": list(prefixes)}
+        if self.ring is not None:
+            cmd["shm"] = self.ring.name
+        if stamps:
+            cmd["stamps"] = True
+        self.sendall(CTRL_PREFIX + json.dumps(cmd).encode() + b"\n")
+
+    def recv(self, size):
+        if self.ring is None:
+            return self.sock.recv(size)
+        while not self.attached:
+            data = self.sock.recv(size)
+            if not data:
+                return b""
+            data = self.rtail + data
+            end = 0 if data.startswith(SHM_ATTACHED) else data.find(b"\n" + SHM_ATTACHED) + 1
+            if end > 0 or data.startswith(SHM_ATTACHED):
+                # only doorbells follow the marker
+                self.attached = True
+                self.rtail = b""
+                data = data[:end]
+            else:
+                # the marker starts at a line
+                eol = data.rfind(b"\n") + 1
+                if SHM_ATTACHED.startswith(data[eol:]):
+                    data, self.rtail = data[:eol], data[eol:]
+            if data:
+                return data
+        while True:
+            data = self.ring.read(size)
+            if not data:
+                # re-check after announcing the wait, the server may have
+                # written in between without ringing
+                self.ring.set(OFS_WAITING, 1)
+                data = self.ring.read(size)
+            if data:
+                if self.ring.take_flag(OFS_FULL):
+                    self.sendall(DRAINED_CMD)
+                return data
+            if not self.sock.recv(size):
+                return b""
+
+    def sendall(self, data):
+        with self.lock:
+            self.sock.sendall(data)
+
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+
+    def close(self):
+        self.sock.close()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def connect(addr="localhost", port=1080, unix=None, shm=0):
+    """ Connect to the server, `shm` is the ring size in bytes (0: none). """
+    if unix:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((addr, port))
+    return Connection(sock, ShmRing.create(shm) if shm else None)
@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     conftest.py
+# Usage:    Shared fixtures, e.g., a server listening on a Unix domain socket.
+#
+
+import os
+import sys
+import time
+import types
+import subprocess
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER_DIR = os.path.join(ROOT, "server")
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, SERVER_DIR)
+
+from simio import shm
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            raise TimeoutError("condition not met")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """ Path of the Unix domain socket of a running server.py. """
+    path = str(tmp_path / "simio.sock")
+    # port 0: the TCP listener binds any free port, clients use the socket
+    proc = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "server.py"), "-p", "0", "-u", path])
+    try:
+        wait_for(lambda: os.path.exists(path))
+        yield path
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+@pytest.fixture(autouse=True)
+def shm_tracking(monkeypatch):
+    """ Rings are attached in the process that created them. Before Python
+        3.13, attach() unregisters the segment from the resource tracker,
+        the creator would unregister it a second time on unlink. """
+    monkeypatch.setattr(shm, "resource_tracker", types.SimpleNamespace(unregister=lambda name, rtype: None))
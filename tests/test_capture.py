@@ -0,0 +1,43 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_capture.py
+# Usage:    Headless capture of the display frames.
+#
+
+import os
+import sys
+import pytest
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "components", "gui", "display"))
+import capture
+
+
+def test_bw_frames():
+    frames = []
+    cap = capture.BWCapture(on_frame=frames.append)
+    cap.feed(b'[displaybw]-{"type": "data", "x": 0, "y": 0, "da')
+    assert not frames
+    cap.feed(b'ta": 255}\n[other]-{}\n')
+    assert len(frames) == 1
+    assert frames[0].shape == (64, 128)
+    assert frames[0].sum() == 8 * 255
+
+
+def test_abstract():
+    class Incomplete(capture.Capture):
+        SRV_PREFIX = "[test]-"
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_bw_out_of_range(caplog):
+    frames = []
+    cap = capture.BWCapture(on_frame=frames.append)
+    cap.feed(b'[displaybw]-{"type": "data", "x": 128, "y": 0, "data": 255}\n'
+             b'[displaybw]-{"type": "burst", "x": -1, "y": 0, "data": "ffff"}\n'
+             b'[displaybw]-{"type": "data", "x": 0, "y": 64, "data": 255}\n')
+    assert all(f.sum() == 0 for f in frames)
+    assert len([r for r in caplog.records if "outside of GRAM" in r.message]) == 3
@@ -0,0 +1,59 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_client.py
+# Usage:    simio Client against a running server.
+#
+
+import pytest
+from conftest import wait_for
+from simio import transport
+from simio.client import Client
+
+
+@pytest.fixture
+def receiver(server):
+    rx = Client("[test]-", unix=server, reconnect=False)
+    rx.connect()
+    yield rx
+    rx.stop()
+
+
+def test_subscribe_send(server, receiver):
+    got = []
+    receiver.start(got.extend)
+    tx = Client("[test]-", unix=server, reconnect=False)
+    tx.connect()
+    tx.send({"a": 1}, "raw")
+    # the client passes on its prefix only, even before the server
+    # handled the subscription and still broadcast to it
+    other = transport.connect(unix=server)
+    other.sendall(b"[other]-not subscribed\n")
+    tx.send("last")
+    wait_for(lambda: len(got) >= 3)
+    assert got == ['{"a": 1}', "raw", "last"]
+    other.close()
+    tx.stop()
+
+
+def test_keeps_receiving_after_error(server, receiver):
+    got = []
+    def on_lines(lines):
+        got.extend(lines)
+        if "bad" in lines:
+            raise ValueError(lines)
+    receiver.start(on_lines)
+    tx = Client("[test]-", unix=server, reconnect=False)
+    tx.connect()
+    tx.send("bad")
+    wait_for(lambda: got)
+    tx.send("good")
+    wait_for(lambda: len(got) >= 2)
+    assert got == ["bad", "good"]
+    tx.stop()
+
+
+def test_send_disconnected():
+    # dropped while not connected, must not raise
+    Client("[test]-").send("lost")
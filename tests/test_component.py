@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_component.py
+# Usage:    Batch dispatch of the GUI component base class.
+#
+
+import os
+import json
+import tkinter as tk
+import pytest
+from conftest import wait_for
+from simio.client import Client
+from simio.component import Component
+
+
+class Recorder(Component):
+    SRV_PREFIX = "[test]-"
+
+    def __init__(self, parent, **kwargs) -> None:
+        super().__init__(parent, **kwargs)
+        self.batches = []
+
+    def parse(self, lines):
+        return [json.loads(l) for l in lines]
+
+    def handle_batch(self, batch):
+        self.batches.append(batch)
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        pytest.skip(f"no display: {e}")
+    yield root
+    root.destroy()
+
+
+def test_abstract():
+    class Incomplete(Component):
+        SRV_PREFIX = "[test]-"
+    # checked before tk.Frame is initialized, no display needed
+    with pytest.raises(TypeError):
+        Incomplete(None)
+
+
+def test_handle_batch(root):
+    c = Recorder(root)
+    c.wake_r, c.wake_w = os.pipe()
+    # the receive thread's part
+    c.push(c.parse(['{"a": 1}', '{"a": 2}']))
+    c.push([3])
+    c.on_wake(c.wake_r, tk.READABLE)
+    assert c.batches == [[{"a": 1}, {"a": 2}, 3]]
+    os.close(c.wake_r)
+    os.close(c.wake_w)
+
+
+def test_handle_batch_from_server(root, server):
+    c = Recorder(root, socks_connect=True, unix=server)
+    c.connect()
+    tx = Client("[test]-", unix=server, reconnect=False)
+    tx.connect()
+    def received():
+        tx.send({"a": 1})
+        root.update()
+        return c.batches
+    wait_for(received)
+    assert all(item == {"a": 1} for batch in c.batches for item in batch)
+    tx.stop()
+    c.client.stop()
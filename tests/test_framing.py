@@ -0,0 +1,37 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_framing.py
+# Usage:    Line framing of received chunks.
+#
+
+from simio.framing import LineFramer
+
+
+def test_split():
+    framer = LineFramer()
+    assert framer.feed(b"a\nbb\n\nccc\n") == [b"a", b"bb", b"", b"ccc"]
+    assert framer.feed(b"") == []
+
+
+def test_partial_lines():
+    framer = LineFramer()
+    assert framer.feed(b"[x]-{\"a\"") == []
+    assert framer.feed(b": 1}\n[x]-") == [b"[x]-{\"a\": 1}"]
+    assert framer.feed(bytearray(b"tail")) == []
+    assert framer.feed(memoryview(b"\nnext\n")) == [b"[x]-tail", b"next"]
+
+
+def test_split_character():
+    framer = LineFramer()
+    data = "ä\n".encode()
+    assert framer.feed(data[:1]) == []
+    assert [l.decode() for l in framer.feed(data[1:])] == ["ä"]
+
+
+def test_reset():
+    framer = LineFramer(delimiter=b";")
+    assert framer.feed(b"a;stale") == [b"a"]
+    framer.reset()
+    assert framer.feed(b"b;") == [b"b"]
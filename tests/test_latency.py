@@ -0,0 +1,23 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_latency.py
+# Usage:    Server stamps interleaved with the received lines.
+#
+
+from simio import latency
+
+CTRL = b"[simio]-"
+
+
+def test_get_stamps():
+    lines = [b'[simio]-{"rx": 20}', b"[x]-a", b'[simio]-{"rx": 10}', b'[simio]-{"fwd": 30}',
+             b'[simio]-{"fwd": 40}', b"[x]-b"]
+    assert latency.get_stamps(lines, CTRL) == {"rx": 10, "fwd": 40}
+
+
+def test_get_stamps_other_control_lines():
+    lines = [b"[simio]-[1, 2]", b"[simio]-42", b'[simio]-"rx"', b"[simio]-{bad",
+             b'[simio]-{"rx": "late"}', b'[simio]-{"stats": {}}', b'[simio]-{"fwd": 5}']
+    assert latency.get_stamps(lines, CTRL) == {"fwd": 5}
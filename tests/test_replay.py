@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_replay.py
+# Usage:    Record a trace and replay it through a running server.
+#
+
+import os
+import sys
+import subprocess
+from conftest import SERVER_DIR
+import tracefile
+from tracefile import TraceWriter
+from simio import transport
+from simio.framing import LineFramer
+
+REPLAY = os.path.join(SERVER_DIR, "replay.py")
+
+LINES = [b'[gamepad]-{"led": %d}\n' % i for i in range(100)]
+
+
+def record(path):
+    trace = TraceWriter(path)
+    for i in range(0, len(LINES), 10):
+        trace.write(b"[gamepad]-", b"".join(LINES[i:i+10]))
+    trace.close()
+
+
+def recv_lines(conn, n):
+    framer = LineFramer()
+    lines = []
+    while len(lines) < n:
+        data = conn.recv(4096)
+        assert data, "server closed the connection"
+        lines += [bytes(l) for l in framer.feed(data)]
+    return lines
+
+
+def record_vga(path, monkeypatch):
+    """ Four frames, 0.5 s apart from the start, with JSON and binary VSync
+        events. """
+    # the first time is the start of the trace
+    times = iter([0] + [int(0.5e9) * i for i in range(4)])
+    monkeypatch.setattr(tracefile.time, "monotonic_ns", lambda: next(times))
+    trace = TraceWriter(path)
+    for f in range(4):
+        if f < 2:
+            data = b"".join(b'[displayvga]-{"type": "vs", "timestamp": %d, "value": %d}\n' % (2*f + i, 1 - i)
+                            for i in range(2))
+        else:
+            data = b"".join(b"[displayvga]-#02%08x%02x0000\n" % (2*f + i, 1 - i) for i in range(2))
+        trace.write(b"[displayvga]-", b'[displayvga]-{"type": "rgb", "timestamp": 0, "r": 1, "g": 1, "b": 1}\n' + data)
+    trace.close()
+
+
+def test_info(tmp_path, monkeypatch):
+    path = str(tmp_path / "vga.trc")
+    record_vga(path, monkeypatch)
+    out = subprocess.run([sys.executable, REPLAY, path, "--info"], capture_output=True, check=True, text=True)
+    assert "duration: 1.500 s" in out.stdout
+    assert "frames:   4" in out.stdout
+    # the index is rebuilt if it is missing
+    os.remove(path + ".idx")
+    out = subprocess.run([sys.executable, REPLAY, path, "--info", "--low-active"], capture_output=True, check=True, text=True)
+    assert "frames:   4" in out.stdout
+
+
+def test_replay(tmp_path, server):
+    path = str(tmp_path / "gamepad.trc")
+    record(path)
+
+    conn = transport.connect(unix=server)
+    conn.subscribe(["[gamepad]-"])
+    # the reply is sent once the subscription is in place
+    conn.sendall(transport.STATS_CMD)
+    assert recv_lines(conn, 1)[0].startswith(b'[simio]-{"stats"')
+
+    subprocess.run([sys.executable, REPLAY, path, "--unix", server], check=True, timeout=10)
+    assert recv_lines(conn, len(LINES)) == [l.rstrip(b"\n") for l in LINES]
+    conn.close()
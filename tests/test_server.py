@@ -0,0 +1,262 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_server.py
+# Usage:    Server internals exercised without running its event loop.
+#
+
+import json
+import time
+import socket
+import selectors
+import pytest
+from server import Server, Client, StateCache
+from simio.shm import ShmRing, POS, OFS_TAIL
+from simio.transport import Connection
+
+
+@pytest.fixture
+def make_srv():
+    servers = []
+    def make(**kwargs):
+        servers.append(Server("localhost", 0, 1, **kwargs))
+        return servers[-1]
+    yield make
+    for s in servers:
+        s.sel.close()
+        for sock in s.listeners:
+            sock.close()
+
+
+@pytest.fixture
+def srv(make_srv):
+    return make_srv(flush_interval=0.01)
+
+
+@pytest.fixture
+def pair():
+    """ Server-side client and the socket of its peer. """
+    a, b = socket.socketpair()
+    yield Client(a, "test"), b
+    a.close()
+    b.close()
+
+
+@pytest.fixture
+def client(pair):
+    return pair[0]
+
+
+@pytest.fixture
+def connect():
+    """ Connects clients to a server, returns each with its peer socket. """
+    socks = []
+    def add(srv, subscriptions=None):
+        a, b = socket.socketpair()
+        socks.extend((a, b))
+        a.setblocking(False)
+        c = Client(a, f"test{len(socks) // 2}")
+        srv.clients[a] = c
+        srv.sel.register(a, selectors.EVENT_READ, c)
+        if subscriptions is None:
+            srv.broadcast.add(c)
+        else:
+            srv.subscribe(c, subscriptions)
+        return c, b
+    yield add
+    for sock in socks:
+        sock.close()
+
+
+def queued_lines(client):
+    return b"".join(client.wq).split(b"\n")[:-1]
+
+
+def test_timeout_skips_stalled_clients(srv, client):
+    srv.queue(client, b"[gamepad]-{}\n")
+    client.wq_since = time.monotonic() - 1.0
+    assert srv.get_timeout() == 0.0
+    # waiting for the socket or the ring to drain, not for the interval
+    client.want_write = True
+    assert srv.get_timeout() is None
+    client.want_write = False
+    client.ring_full = True
+    assert srv.get_timeout() is None
+
+
+def test_corrupt_ring_drops_client(srv, client):
+    ring = ShmRing.create(16)
+    srv.clients[client.sock] = client
+    srv.sel.register(client.sock, selectors.EVENT_READ, client)
+    srv.attach_ring(client, ring.name)
+    srv.flush(client)
+    assert client.ring is not None
+    # the client claims to have consumed more than was written
+    POS.pack_into(ring.buf, OFS_TAIL, 1 << 20)
+    srv.queue(client, b"[gamepad]-" + bytes(100) + b"\n")
+    srv.flush(client)
+    assert client.sock not in srv.clients
+    ring.close()
+
+
+def test_ring_handshake(srv, pair):
+    client, peer = pair
+    ring = ShmRing.create(4096)
+    srv.clients[client.sock] = client
+    srv.sel.register(client.sock, selectors.EVENT_READ, client)
+    # "[x]-" of the first frame was written to the socket already
+    client.wq.extend([memoryview(b"[x]-first\n")[4:], b"[x]-second\n"])
+    client.wq_bytes = 17
+    srv.pending.add(client)
+    srv.attach_ring(client, ring.name)
+    assert client.ring is None
+    srv.flush(client)
+    assert client.ring is not None
+    conn = Connection(peer, ring)
+    assert conn.recv(4096) == b"first\n"
+    assert conn.recv(4096) == b"[x]-second\n"
+    client.ring.close()
+    ring.close()
+
+
+def test_route_mixed_prefixes(srv, connect):
+    producer, _ = connect(srv)
+    subset, _ = connect(srv, [b"[a]-", b"[c]-"])
+    everything, _ = connect(srv)
+    srv.route(producer, b"[a]-1\n[b]-1\n[a]-2\n"
+                        b'[simio]-{"subscribe": ["[b]-"]}\n'
+                        b"[c]-1\n[b]-2\n[a]-3\n")
+    assert queued_lines(subset) == [b"[a]-1", b"[a]-2", b"[c]-1", b"[a]-3"]
+    # the control line is handled by the server, not forwarded
+    assert queued_lines(everything) == [b"[a]-1", b"[b]-1", b"[a]-2", b"[c]-1", b"[b]-2", b"[a]-3"]
+    assert producer.subscriptions == {b"[b]-"}
+    assert not producer.wq
+    assert producer.lines_in == 6
+    assert srv.prefix_stats == {b"[a]-": [3, 18], b"[b]-": [2, 12], b"[c]-": [1, 6]}
+
+
+def test_partial_lines(srv, connect):
+    producer, peer = connect(srv)
+    consumer, _ = connect(srv)
+    for data in (b"[x]-a", b"b\n[x]-c", b"d", b"\n[x]-e\n"):
+        peer.sendall(data)
+        srv.handle_read(producer)
+    assert queued_lines(consumer) == [b"[x]-ab", b"[x]-cd", b"[x]-e"]
+    assert not producer.rbuf
+
+
+def test_line_too_long(srv, connect, monkeypatch):
+    monkeypatch.setattr(Server, "MAX_LINE", 16)
+    producer, peer = connect(srv)
+    consumer, _ = connect(srv)
+    peer.sendall(b"[x]-complete\n[x]-" + bytes(10))
+    srv.handle_read(producer)
+    assert producer.sock in srv.clients
+    peer.sendall(bytes(10))
+    srv.handle_read(producer)
+    assert producer.sock not in srv.clients
+    assert queued_lines(consumer) == [b"[x]-complete"]
+
+
+def test_policy_block(make_srv, connect):
+    srv = make_srv(queue_size=100, policy="block")
+    producer, _ = connect(srv)
+    consumer, peer = connect(srv)
+    lines = [b"[x]-%015d\n" % i for i in range(6)]
+    for line in lines:
+        srv.forward(producer, b"[x]-", line)
+    # nothing is lost, the producer is no longer read from
+    assert queued_lines(consumer) == [l[:-1] for l in lines]
+    assert producer.paused_by == {consumer}
+    assert producer.events == 0
+    srv.flush(consumer)
+    assert peer.recv(4096) == b"".join(lines)
+    assert not producer.paused_by
+    assert producer.events == selectors.EVENT_READ
+    assert (consumer.dropped, consumer.coalesced) == (0, 0)
+
+
+def test_policy_drop_oldest(make_srv, connect):
+    srv = make_srv(queue_size=100, policy="drop-oldest")
+    producer, _ = connect(srv)
+    consumer, _ = connect(srv)
+    for i in range(7):
+        srv.forward(producer, b"[x]-", b"[x]-%015d\n" % i)
+    # the 6th line exceeded the queue, the oldest lines were dropped down
+    # to half of the queue size
+    assert queued_lines(consumer) == [b"[x]-%015d" % i for i in (4, 5, 6)]
+    assert (consumer.dropped, consumer.coalesced) == (4, 0)
+    assert consumer.wq_bytes == 60
+    assert not producer.paused_by
+
+
+def test_compact_keeps_partial_frame(make_srv, connect):
+    srv = make_srv(queue_size=100, policy="drop-oldest")
+    client, _ = connect(srv)
+    # "[x]-" of the first frame was written already
+    client.wq.extend([memoryview(b"[x]-%015d\n" % 0)[4:]] + [b"[x]-%015d\n" % i for i in range(1, 6)])
+    client.wq_bytes = 116
+    srv.compact(client)
+    assert queued_lines(client) == [b"%015d" % 0, b"[x]-%015d" % 5]
+    assert client.dropped == 4
+    assert client.wq_bytes == 36
+
+
+def test_policy_coalesce(make_srv, connect):
+    srv = make_srv(queue_size=100, policy="coalesce")
+    producer, _ = connect(srv)
+    consumer, _ = connect(srv)
+    for i in range(5):
+        srv.forward(producer, b"[x]-", b'[x]-{"type": "cmd", "inv": %d}\n' % i)
+    # compacted when the 4th line exceeded the queue size
+    assert queued_lines(consumer) == [b'[x]-{"type": "cmd", "inv": %d}' % i for i in (3, 4)]
+    assert (consumer.dropped, consumer.coalesced) == (0, 3)
+    assert not producer.paused_by
+
+
+def test_state_cache():
+    cache = StateCache(b"[displaybw]-")
+    cache.update(b'[displaybw]-{"type": "cmd", "inv": true}\n'
+                 b'[displaybw]-{"type": "data", "x": 0, "y": 0, "data": 1}\n'
+                 b'[displaybw]-{"type": "burst", "x": 0, "y": 0, "data": "02030405"}\n')
+    cache.update(b'[displaybw]-{"type": "data", "x": 1, "y": 0, "data": 9}\n'
+                 b'[displaybw]-{"type": "burst", "x": 5, "y": 48, "data": "0a0b0c", "vertical": true}\n'
+                 b'[displaybw]-{"type": "cmd", "inv": false}\n')
+    lines = cache.snapshot().split(b"\n")[:-1]
+    # the vertical burst is cut at the last page
+    assert len(lines) == 4
+    page0 = bytes.fromhex(json.loads(lines[0][12:])["data"])
+    assert page0[:5] == bytes([2, 9, 4, 5, 0])
+    page6 = bytes.fromhex(json.loads(lines[1][12:])["data"])
+    page7 = bytes.fromhex(json.loads(lines[2][12:])["data"])
+    assert (page6[5], page7[5]) == (0x0a, 0x0b)
+    assert lines[3] == b'[displaybw]-{"type": "cmd", "inv": false}'
+
+
+def test_state_cache_parses_lazily(monkeypatch):
+    cache = StateCache(b"[displaybw]-")
+    frame = b"".join(b'[displaybw]-{"type": "burst", "x": 0, "y": %d, "data": "%s"}\n' % (8*p, b"ff"*128)
+                     for p in range(8))
+    loads = []
+    monkeypatch.setattr(json, "loads", lambda s: loads.append(s) or json.JSONDecoder().decode(s.decode()))
+    for _ in range(100):
+        cache.update(frame)
+    assert not loads
+    # older frames are overwritten by the last one
+    assert cache.snapshot().count(b"\n") == 8
+    assert len(loads) == 8
+
+
+def test_stamp_after_partial_frame(srv, pair):
+    client, peer = pair
+    client.stamps = True
+    # "[x]-" of the first frame was written already
+    client.wq.extend([memoryview(b"[x]-partial\n")[4:], b"[x]-next\n"])
+    client.wq_bytes = 17
+    srv.pending.add(client)
+    srv.flush(client)
+    lines = peer.recv(4096).split(b"\n")
+    assert lines[0] == b"partial"
+    assert lines[1].startswith(b'[simio]-{"fwd": ')
+    assert lines[2:] == [b"[x]-next", b""]
@@ -0,0 +1,62 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_shm.py
+# Usage:    Shared-memory ring transfers and header validation.
+#
+
+import socket
+import pytest
+from multiprocessing import shared_memory
+from simio.shm import ShmRing, POS, OFS_CAPACITY
+from simio.transport import Connection, SHM_ATTACHED, DOORBELL
+
+
+@pytest.fixture
+def ring():
+    r = ShmRing.create(16)
+    yield r
+    r.close()
+
+
+def test_wrap_around(ring):
+    peer = ShmRing.attach(ring.name)
+    assert peer.write([b"0123456789"]) == 10
+    assert ring.read(8) == b"01234567"
+    # the copy wraps at the end of the ring, 2 of 16 bytes are left over
+    assert peer.write([b"abcdef", b"ghijkl", b"mnop"]) == 14
+    assert ring.read(100) == b"89abcdefghijklmn"
+    peer.close()
+
+
+@pytest.mark.parametrize("capacity", [0, 17, 1 << 40])
+def test_attach_invalid_capacity(ring, capacity):
+    POS.pack_into(ring.buf, OFS_CAPACITY, capacity)
+    with pytest.raises(ValueError):
+        ShmRing.attach(ring.name)
+
+
+def test_attach_short_segment():
+    shm = shared_memory.SharedMemory(create=True, size=8)
+    try:
+        with pytest.raises(ValueError):
+            ShmRing.attach(shm.name)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_socket_before_ring(ring):
+    a, b = socket.socketpair()
+    conn = Connection(b, ring)
+    peer = ShmRing.attach(ring.name)
+    peer.write([b"[x]-ring\n"])
+    # sent on the socket before the server switched to the ring
+    a.sendall(b"[x]-sock\n" + SHM_ATTACHED[:5])
+    assert conn.recv(100) == b"[x]-sock\n"
+    a.sendall(SHM_ATTACHED[5:] + DOORBELL)
+    assert conn.recv(100) == b"[x]-ring\n"
+    peer.close()
+    a.close()
+    b.close()
@@ -0,0 +1,58 @@
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     test_vga_state.py
+# Usage:    Decoding of the VGA model's wire formats into the framebuffer.
+#
+
+import os
+import sys
+import numpy as np
+import pytest
+from conftest import ROOT
+from simio.framing import LineFramer
+
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+import bench
+import vga_state
+
+SETTINGS = vga_state.VGASetting(width=64, height=48)
+
+
+def decode(frames):
+    ds = vga_state.DisplayState(SETTINGS)
+    framer = LineFramer()
+    n = len(bench.PREFIXES["vga"])
+    for frame in frames:
+        ds.handle_frames([l[n:].decode() for l in framer.feed(frame)])
+    return ds
+
+
+def test_formats_match():
+    decoded = {fmt: decode(bench.gen_vga(SETTINGS, 3, 8, fmt)) for fmt in ("json", "bin", "line")}
+    # the VSync ending the last frame is sent with the next one
+    assert [ds.frame_cnt for ds in decoded.values()] == [2, 2, 2]
+    assert decoded["json"].frame.any()
+    assert np.array_equal(decoded["json"].frame, decoded["bin"].frame)
+    assert np.array_equal(decoded["json"].frame, decoded["line"].frame)
+
+
+@pytest.mark.parametrize("split", [3, 1, 2])
+def test_same_timestamp(split):
+    ds = vga_state.DisplayState(SETTINGS)
+    # first visible line, one pixel per time unit since the HSync edge
+    ds.y = SETTINGS.v_back_porch_ln
+    ds.time_per_pixel = 1.0
+    x0 = SETTINGS.h_back_porch_px
+    events = np.array([(x0, vga_state.REC_RGB, 3, 0, 0),
+                       (x0 + 10, vga_state.REC_RGB, 0, 3, 0),
+                       (x0 + 10, vga_state.REC_RGB, 0, 0, 3),
+                       (x0 + 20, vga_state.REC_RGB, 0, 0, 0)], dtype=vga_state.EVENT_DTYPE)
+    # within one batch or split between two
+    ds.handle_events(events[:split])
+    ds.handle_events(events[split:])
+    # only the last of the changes at x0+10 is visible
+    assert (ds.framebuffer[0, :10] == (192, 0, 0)).all()
+    assert (ds.framebuffer[0, 10:20] == (0, 0, 192)).all()
+    assert not ds.framebuffer[0, 20:].any()
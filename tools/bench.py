@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Meinhard Kissich
+# SPDX-License-Identifier: MIT
+#
+# File:     bench.py
+# Usage:    Headless benchmarks with synthetic traffic, no simulator needed.
+#
+#             decode: decode rate (frames/s) and memory of the display
+#                     states, fed like a GUI's receive thread.
+#             server: throughput of a server started for the benchmark,
+#                     with one producer and --fanout subscribers.
+#
+#           Results are written as JSON, e.g., to track regressions:
+#
+#             python3 tools/bench.py decode vga --format bin -o vga.json
+#             python3 tools/bench.py server bw --fanout 4 --rate 20
+#
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import resource
+import threading
+import subprocess
+import tracemalloc
+import logging
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "components/gui/display"))
+from simio import transport
+from simio import log
+from simio.framing import LineFramer
+import vga_state
+import bw_state
+
+logger = logging.getLogger(__name__)
+
+PREFIXES = {"vga": "[displayvga]-", "bw": "[displaybw]-", "gamepad": "[gamepad]-"}
+# Bytes per read of the decode benchmark, like Component.RECV_SIZE
+CHUNK_SIZE = 256*1024
+# Pixel clock of the generated VGA timing [ns]
+VGA_PX_NS = 40
+
+
+def gen_vga(settings, frames, changes, fmt, seed=0):
+    """ Frames of VGA events, one bytes object of complete lines each: per
+        line, the HSync pulse followed by `changes` color changes spread
+        over the visible pixels, VSync at the first lines. """
+    rng = np.random.default_rng(seed)
+    total_w = settings.width + settings.h_front_porch_px + settings.h_sync_pulse_px + settings.h_back_porch_px
+    total_h = settings.height + settings.v_front_porch_ln + settings.v_sync_pulse_ln + settings.v_back_porch_ln
+    active = int(not settings.low_active_hs_vs)
+    x_changes = settings.h_sync_pulse_px + settings.h_back_porch_px + \
+                np.linspace(0, settings.width, changes, endpoint=False).astype(np.int64)
+    events = []
+    for ln in range(total_h):
+        t = ln * total_w
+        if ln == 0:
+            events.append((t, vga_state.REC_VS, active, 0, 0))
+        if ln == settings.v_sync_pulse_ln:
+            events.append((t, vga_state.REC_VS, 1-active, 0, 0))
+        events.append((t, vga_state.REC_HS, active, 0, 0))
+        events.append((t + settings.h_sync_pulse_px, vga_state.REC_HS, 1-active, 0, 0))
+        colors = rng.integers(0, 2**settings.color_depth, size=(changes, 3))
+        events += [(t + x, vga_state.REC_RGB, *c) for x, c in zip(x_changes.tolist(), colors.tolist())]
+    events = np.array(events, dtype=np.int64)
+    prefix = PREFIXES["vga"]
+    if fmt == "line":
+        line_events = to_line_events(events, settings.color_depth)
+    result = []
+    for f in range(frames):
+        timestamps = (events[:, 0] + f * total_w * total_h) * VGA_PX_NS % 2**32
+        if fmt == "line":
+            lines = [f'{prefix}{{"type":"line","timestamp":{(t + f * total_w * total_h) * VGA_PX_NS % 2**32},"value":{v},"data":"{data}"}}\n'
+                     if k == vga_state.REC_HS else
+                     f'{prefix}{{"type":"vs","timestamp":{(t + f * total_w * total_h) * VGA_PX_NS % 2**32},"value":{v}}}\n'
+                     for t, k, v, data in line_events]
+        elif fmt == "bin":
+            records = np.zeros(len(events), dtype=vga_state.RECORD_DTYPE)
+            records["type"] = events[:, 1]
+            records["timestamp"] = timestamps
+            for i, c in enumerate("rgb"):
+                records[c] = events[:, 2+i]
+            h = records.tobytes().hex()
+            n = 2 * records.itemsize
+            lines = [f"{prefix}#{h[i:i+n]}\n" for i in range(0, len(h), n)]
+        else:
+            names = {vga_state.REC_RGB: "rgb", vga_state.REC_HS: "hs", vga_state.REC_VS: "vs"}
+            lines = [f'{prefix}{{"type":"rgb","timestamp":{t},"r":{r},"g":{g},"b":{b}}}\n' if k == vga_state.REC_RGB else
+                     f'{prefix}{{"type":"{names[k]}","timestamp":{t},"value":{r}}}\n'
+                     for t, k, r, g, b in zip(timestamps.tolist(), *events[:, 1:].T.tolist())]
+        result.append("".join(lines).encode())
+    return result
+
+def to_line_events(events, color_depth):
+    """ Convert events to WIRE_FORMAT "line": (t, type, value, data) of
+        every HS edge, with the hex encoded pixels since the previous one,
+        and of every VS edge. """
+    n = (3*color_depth + 7) // 8
+    result = []
+    rgb = 0
+    last_hs = 0
+    changes = []
+    for t, k, r, g, b in events.tolist():
+        if k == vga_state.REC_RGB:
+            changes.append((t, (r << 2*color_depth) | (g << color_depth) | b))
+        elif k == vga_state.REC_VS:
+            result.append((t, k, r, ""))
+        else:
+            px = np.full(t - last_hs, rgb, dtype=np.uint32)
+            for tc, value in changes:
+                px[tc - last_hs:] = value
+                rgb = value
+            changes = []
+            data = px.astype(">u4").view(np.uint8).reshape(-1, 4)[:, 4-n:].tobytes().hex()
+            result.append((t, k, r, data))
+            last_hs = t
+    return result
+
+def gen_bw(frames, w=128, h=64, seed=0):
+    """ Frames of SSD1306 page bursts with random content. """
+    rng = np.random.default_rng(seed)
+    prefix = PREFIXES["bw"]
+    result = []
+    for _ in range(frames):
+        pages = rng.integers(0, 256, size=(h // 8, w), dtype=np.uint8)
+        result.append("".join(f'{prefix}{{"type":"burst","x":0,"y":{8*p},"data":"{pages[p].tobytes().hex()}"}}\n'
+                              for p in range(h // 8)).encode())
+    return result
+
+def gen_gamepad(frames, seed=0):
+    """ LED updates, one per frame. """
+    rng = np.random.default_rng(seed)
+    prefix = PREFIXES["gamepad"]
+    return [f'{prefix}{{"led1":{json.dumps(bool(a))},"led2":{json.dumps(bool(b))}}}\n'.encode()
+            for a, b in rng.integers(0, 2, size=(frames, 2))]
+
+def generate(args):
+    if args.display == "vga":
+        return gen_vga(vga_state.get_vga_settings(args), args.frames, args.changes, args.format)
+    if args.display == "bw":
+        return gen_bw(args.frames)
+    return gen_gamepad(args.frames)
+
+
+def chunks(frames, size=CHUNK_SIZE):
+    """ Split the generated data into reads of `size` bytes, independent
+        of line boundaries. """
+    data = b"".join(frames)
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+def decode(args, data):
+    """ Frame the data, strip the prefix and decode it like the GUIs do,
+        returns the number of completed frames. """
+    if args.display == "vga":
+        ds = vga_state.DisplayState(vga_settings=vga_state.get_vga_settings(args))
+        handle = ds.handle_frames
+    else:
+        ds = bw_state.DisplayState(scale=1)
+        ds.frame_cnt = 0
+        def handle(lines):
+            for l in lines:
+                ds.handle_rx(l)
+            if ds.dirty:
+                ds.get_frame()
+                ds.frame_cnt += 1
+    prefix = PREFIXES[args.display].encode()
+    n = len(prefix)
+    framer = LineFramer()
+    for chunk in data:
+        handle([l[n:].decode() for l in framer.feed(chunk) if l.startswith(prefix)])
+    return ds.frame_cnt
+
+def bench_decode(args, frames):
+    # SSD1306 frames are small, a GUI receives and redraws each one
+    data = chunks(frames) if args.display == "vga" else frames
+    t_start = time.perf_counter()
+    completed = decode(args, data)
+    elapsed = time.perf_counter() - t_start
+    # tracing allocations slows decoding down, measure memory separately
+    peak = None
+    if args.memory:
+        tracemalloc.start()
+        decode(args, data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    size = sum(len(c) for c in data)
+    return {
+        "frames": len(frames),
+        "frames_completed": completed,
+        "bytes": size,
+        "seconds": elapsed,
+        "frames_per_s": len(frames) / elapsed,
+        "mb_per_s": size / elapsed / 1e6,
+        "peak_alloc_bytes": peak,
+    }
+
+
+def receive(conn, total, result, i):
+    got = 0
+    while got < total:
+        data = conn.recv(CHUNK_SIZE)
+        if not data:
+            break
+        got += len(data)
+    result[i] = (got, time.perf_counter())
+
+def wait_for_server(port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("localhost", port)).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def bench_server(args, frames):
+    """ Send the frames through a freshly started server to --fanout
+        subscribers, at most --rate MB/s. """
+    cmd = [sys.executable, os.path.join(ROOT, "server/server.py"), "-p", str(args.port), "-n", str(args.fanout + 2),
+           "--log-level", "ERROR"] + args.server_args
+    server = subprocess.Popen(cmd)
+    try:
+        wait_for_server(args.port)
+        subscribers = [transport.connect(port=args.port, unix=None, shm=args.shm*1024) for _ in range(args.fanout)]
+        for s in subscribers:
+            s.subscribe([PREFIXES[args.display]])
+        producer = transport.connect(port=args.port)
+        producer.subscribe([])
+        # let the server process the subscriptions
+        time.sleep(0.2)
+
+        data = chunks(frames)
+        total = sum(len(c) for c in data)
+        result = [None] * args.fanout
+        threads = [threading.Thread(target=receive, args=(s, total, result, i), daemon=True)
+                   for i, s in enumerate(subscribers)]
+        for t in threads:
+            t.start()
+        t_start = time.perf_counter()
+        sent = 0
+        for chunk in data:
+            producer.sendall(chunk)
+            sent += len(chunk)
+            if args.rate:
+                delay = sent / (args.rate * 1e6) - (time.perf_counter() - t_start)
+                if delay > 0:
+                    time.sleep(delay)
+        t_sent = time.perf_counter()
+        for t in threads:
+            t.join(args.timeout)
+        for s in subscribers + [producer]:
+            s.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    received = [r for r in result if r is not None]
+    t_end = max((r[1] for r in received), default=t_sent)
+    elapsed = t_end - t_start
+    return {
+        "fanout": args.fanout,
+        "rate_limit_mb_per_s": args.rate,
+        "bytes_sent": total,
+        "bytes_received": [r[0] for r in received],
+        "complete": len(received) == args.fanout and all(r[0] == total for r in received),
+        "send_seconds": t_sent - t_start,
+        "seconds": elapsed,
+        "frames_per_s": len(frames) / elapsed,
+        "mb_per_s_in": total / elapsed / 1e6,
+        "mb_per_s_out": sum(r[0] for r in received) / elapsed / 1e6,
+    }
+
+
+def main(args):
+    if (args.mode == "decode") and (args.display == "gamepad"):
+        logger.error("The gamepad has no display state, use the server benchmark")
+        return 1
+    t_start = time.perf_counter()
+    frames = generate(args)
+    logger.info(f"Generated {len(frames)} {args.display} frames ({sum(len(f) for f in frames)/1e6:.1f} MB) "
+                f"in {time.perf_counter() - t_start:.1f} s")
+
+    results = bench_decode(args, frames) if args.mode == "decode" else bench_server(args, frames)
+    report = {
+        "benchmark": args.mode,
+        "display": args.display,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "log_level", "log_file", "trace")},
+        "host": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                 "system": platform.system()},
+        "results": results,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    print(out)
+    return 0
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Headless SimIO benchmarks with synthetic traffic")
+    parser.add_argument("mode", choices=("decode", "server"), help="Benchmark to run")
+    parser.add_argument("display", choices=tuple(PREFIXES), help="Component whose traffic is generated")
+    parser.add_argument("-n", "--frames", action="store", type=int, default=60, help="Number of generated frames")
+    parser.add_argument("-c", "--changes", action="store", type=int, default=32, help="VGA color changes per line")
+    parser.add_argument("-F", "--format", action="store", choices=("json", "bin", "line"), default="json", help="VGA wire format, see simio_vga.sv")
+    parser.add_argument("-m", "--memory", action="store_true", help="Measure the peak memory allocated while decoding in a second pass (decode)")
+    parser.add_argument("-k", "--fanout", action="store", type=int, default=1, help="Number of subscribers (server)")
+    parser.add_argument("-r", "--rate", action="store", type=float, default=0, help="Maximum send rate [MB/s] (server), 0 for no limit")
+    parser.add_argument("-p", "--port", action="store", type=int, default=10800, help="Port of the started server (server)")
+    parser.add_argument("--shm", action="store", type=int, default=0, help="Subscribers receive through shared-memory rings of this many KiB (server)")
+    parser.add_argument("--timeout", action="store", type=float, default=60, help="Maximum time to wait for the subscribers [s] (server)")
+    parser.add_argument("-S", "--server-args", action="store", type=str, nargs=argparse.REMAINDER, default=[],
+                        help="Further arguments passed to server.py, e.g., -S --policy drop-oldest")
+    parser.add_argument("-o", "--output", action="store", type=str, default=None, help="Write the results to this JSON file")
+    vga_state.add_vga_args(parser)
+    log.add_log_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    log.setup_logging(args)
+
+    sys.exit(main(args))